@@ -1,13 +1,36 @@
+import os
+import time
+import json
 import quool
 import barra
+import quotes
 import datetime
+import threading
+import multiprocessing
+import graph
 import highfreq
+import snapshot
 import financial
+import fundamental
+import numpy as np
 import factor as ft
-import akshare as ak
+import pandas as pd
+from pathlib import Path
+from concurrent.futures import (
+    Future, ThreadPoolExecutor, ProcessPoolExecutor, as_completed)
 from flask import Flask, jsonify, request
 
 app = Flask("FactorStrategy")
+logger = quool.Logger("FactorDump")
+QUOTES_URI = '/home/data/quotes-day'
+GRAPH = graph.FactorGraph(QUOTES_URI)
+SNAPSHOTS = snapshot.SnapshotStore()
+# FACTOR_QUOTES_FILE points to a local spot table for running without network
+QUOTES = quotes.CachedQuotes(
+    quotes.FileQuotes(os.environ["FACTOR_QUOTES_FILE"])
+    if os.environ.get("FACTOR_QUOTES_FILE") else quotes.AkshareQuotes(),
+    ttl=3,
+)
 
 FACTOR_INFO = {
     "logsize": {"module": barra, "uri": "/home/data/barra"},
@@ -18,34 +41,293 @@ FACTOR_INFO = {
     "roe": {"module": financial, "uri": "/home/data/factor"},
     "current_asset_ratio": {"module": financial, "uri": "/home/data/factor"},
 }
+for module in set(info["module"] for info in FACTOR_INFO.values()):
+    module.register(GRAPH)
 
 
 @app.route('/factors')
 def factors():
     return jsonify({"factors": list(FACTOR_INFO.keys())})
 
+def compute(factor: str, start: str, stop: str, n_jobs: int = 4) -> pd.DataFrame:
+    if factor in GRAPH.nodes:
+        return GRAPH.run(factor, start, stop, n_jobs)[factor]
+    return getattr(FACTOR_INFO[factor]["module"], f'get_{factor}')(start, stop)
+
+def update_fundamental(stop: str):
+    # the daily financial store is brought up to date once per job, builders only read it
+    fundamental.update(fundamental.FIELDS, stop)
+
+def reads_fundamental(factor: str) -> bool:
+    # builders outside the graph cannot be told apart, they are taken to read it
+    if factor not in GRAPH.nodes:
+        return True
+    return any(GRAPH.nodes[name].kind.startswith(f'field:{fundamental.PIT_URI}:')
+        for name in GRAPH.ancestors(factor))
+
 def dump(factor: str, start: str, stop: str):
-    data = getattr(FACTOR_INFO[factor]["module"], f'get_{factor}')(start, stop)
+    data = compute(factor, start, stop)
     ft.save_data(data, factor, FACTOR_INFO[factor]["uri"])
+    snapshot.write_snapshot(data, factor, FACTOR_INFO[factor]["uri"])
+    return data
+
+def dump_all(start: str, stop: str, factors: list = None, n_jobs: int = 4):
+    # shared intermediates like adjusted close are computed once for every factor
+    factors = factors or list(FACTOR_INFO)
+    update_fundamental(stop)
+    data = GRAPH.run([f for f in factors if f in GRAPH.nodes], start, stop, n_jobs)
+    for factor in factors:
+        if factor not in data:
+            data[factor] = getattr(FACTOR_INFO[factor]["module"], f'get_{factor}')(start, stop)
+        ft.save_data(data[factor], factor, FACTOR_INFO[factor]["uri"])
+        snapshot.write_snapshot(data[factor], factor, FACTOR_INFO[factor]["uri"])
+    return data
+
+def _state_path(uri: str) -> Path:
+    # dot files are skipped by the parquet reader of the table
+    return Path(uri).expanduser() / '.dump-state.json'
+
+def load_state(uri: str) -> dict:
+    path = _state_path(uri)
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+def save_state(uri: str, state: dict):
+    path = _state_path(uri)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(state, indent=2))
+    tmp.replace(path)
+
+def pending_ranges(factor: str, stop: str, start: str = None) -> list[tuple[str, str]]:
+    uri = FACTOR_INFO[factor]["uri"]
+    record = load_state(uri).get(factor, {"failed": []})
+    ranges = [tuple(rng) for rng in record["failed"]]
+    calendar = ft.get_calendar(QUOTES_URI)
+    last = ft.get_last_date(uri, factor)
+    if last is not None:
+        begin = calendar.next(last) if last < calendar.days[-1] else None
+    elif start is not None:
+        begin = pd.to_datetime(start)
+    else:
+        raise ValueError(f"{factor} has no history in {uri}, start is required")
+    if begin is not None and begin <= pd.to_datetime(stop):
+        ranges.append((begin.strftime(r'%Y-%m-%d'), pd.to_datetime(stop).strftime(r'%Y-%m-%d')))
+    return merge_ranges(ranges, calendar)
+
+def merge_ranges(ranges: list, calendar: ft.TradingCalendar) -> list[tuple[str, str]]:
+    # overlapping ranges, or ranges without a trading day between them, are dumped once
+    merged = []
+    for begin, end in sorted((pd.to_datetime(a), pd.to_datetime(b)) for a, b in ranges):
+        if merged and not len(calendar.range(merged[-1][1] + pd.Timedelta(days=1), 
+            begin - pd.Timedelta(days=1))):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((begin, end))
+    return [(begin.strftime(r'%Y-%m-%d'), end.strftime(r'%Y-%m-%d')) for begin, end in merged]
+
+def record_state(uri: str, failed: dict[str, list]):
+    state = load_state(uri)
+    for factor, ranges in failed.items():
+        record = state.setdefault(factor, {"failed": []})
+        record["failed"] = ranges
+        last = ft.get_last_date(uri, factor)
+        record["hwm"] = last and last.strftime(r'%Y-%m-%d')
+    save_state(uri, state)
+
+def update(factor: str, stop: str, start: str = None):
+    update_fundamental(stop)
+    failed = []
+    for rng in pending_ranges(factor, stop, start):
+        try:
+            logger.info(f"dumping {factor} from {rng[0]} to {rng[1]}")
+            dump(factor, *rng)
+        except Exception as e:
+            logger.error(f"failed to dump {factor} from {rng[0]} to {rng[1]}: {e}")
+            failed.append(list(rng))
+    record_state(FACTOR_INFO[factor]["uri"], {factor: failed})
+    return failed
+
+def _timed_compute(
+    factors: list, 
+    start: str, 
+    stop: str, 
+    n_jobs: int = 1,
+) -> tuple[dict[str, pd.DataFrame], float]:
+    begin = time.perf_counter()
+    # one graph run per worker, the shared nodes of the batch are computed once
+    graphed = [factor for factor in factors if factor in GRAPH.nodes]
+    data = GRAPH.run(graphed, start, stop, n_jobs) if graphed else {}
+    for factor in factors:
+        if factor not in data:
+            data[factor] = compute(factor, start, stop, n_jobs)
+    return data, time.perf_counter() - begin
+
+def _batches(jobs: list) -> list[tuple[list, tuple]]:
+    # factors due over the same range are batched by the graph nodes they share
+    ranges = {}
+    for factor, rng in jobs:
+        ranges.setdefault(rng, []).append(factor)
+    batches = []
+    for rng, factors in ranges.items():
+        graphed = [factor for factor in factors if factor in GRAPH.nodes]
+        batches += [(group, rng) for group in GRAPH.groups(graphed)]
+        batches += [([factor], rng) for factor in factors if factor not in GRAPH.nodes]
+    return batches
+
+
+class TableWriter:
+
+    def __init__(self, uri: str):
+        self.uri = uri
+        self._lock = threading.Lock()
+        self._pending = []
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def submit(self, factor: str, data: pd.DataFrame) -> Future:
+        future = Future()
+        with self._lock:
+            self._pending.append((factor, data, future))
+        self._executor.submit(self._flush)
+        return future
+
+    def _flush(self):
+        # everything queued while the previous write ran goes out in one pass over the table
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        panels = {}
+        for factor, data, _ in batch:
+            panels.setdefault(factor, []).append(data)
+        panels = {factor: pd.concat(frames) if len(frames) > 1 else frames[0]
+            for factor, frames in panels.items()}
+        panels = {factor: data[~data.index.duplicated(keep='last')].sort_index()
+            for factor, data in panels.items()}
+        try:
+            begin = time.perf_counter()
+            ft.save_panels(panels, self.uri)
+            shared = time.perf_counter() - begin
+            snapshots = {}
+            for factor, data in panels.items():
+                begin = time.perf_counter()
+                snapshot.write_snapshot(data, factor, self.uri)
+                snapshots[factor] = time.perf_counter() - begin
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        # the one table write is shared out by rows, each snapshot among its own factor's ranges
+        rows = [int(data.count().sum()) for _, data, _ in batch]
+        total = max(sum(rows), 1)
+        factor_rows = {}
+        for (factor, _, _), n in zip(batch, rows):
+            factor_rows[factor] = factor_rows.get(factor, 0) + n
+        for (factor, _, future), n in zip(batch, rows):
+            future.set_result((n, shared * n / total 
+                + snapshots[factor] * n / max(factor_rows[factor], 1)))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+def run_dumps(
+    factors: list = None,
+    stop: str = None,
+    start: str = None,
+    max_workers: int = None,
+) -> pd.DataFrame:
+    factors = factors or list(FACTOR_INFO)
+    stop = stop or datetime.datetime.now().strftime(r'%Y-%m-%d')
+    report = {factor: {"uri": FACTOR_INFO[factor]["uri"], "ranges": 0, "compute": 0.,
+        "write": 0., "rows": 0, "failed": []} for factor in factors}
+    jobs = []
+    for factor in factors:
+        try:
+            jobs += [(factor, rng) for rng in pending_ranges(factor, stop, start)]
+        except Exception as e:
+            logger.error(f"failed to plan {factor}: {e}")
+        report[factor]["ranges"] = sum(job[0] == factor for job in jobs)
+
+    # workers only read the daily financial store, when it could not be brought up to 
+    # date the factors reading it are failed and retried next run, not written stale
+    try:
+        update_fundamental(stop)
+    except Exception as e:
+        logger.error(f"failed to update {fundamental.PIT_URI}: {e}")
+        for factor, rng in jobs:
+            if reads_fundamental(factor):
+                report[factor]["failed"].append(list(rng))
+        jobs = [(factor, rng) for factor, rng in jobs if not reads_fundamental(factor)]
+
+    writers = {uri: TableWriter(uri) for uri in set(info["uri"] for info in report.values())}
+    writing = {}
+    batches = _batches(jobs)
+    # each worker process is one unit of the concurrency limit, fewer batches than 
+    # workers leave the spare cores to the graph threads inside a batch
+    max_workers = max_workers or os.cpu_count() or 1
+    n_jobs = max(max_workers // max(len(batches), 1), 1)
+    # writer threads are already running, forking would copy their locks mid-use
+    with ProcessPoolExecutor(max_workers=max_workers, 
+        mp_context=multiprocessing.get_context('spawn')) as pool:
+        computing = {pool.submit(_timed_compute, factors, *rng, n_jobs): (factors, rng) 
+            for factors, rng in batches}
+        for future in as_completed(computing):
+            factors, rng = computing[future]
+            try:
+                data, seconds = future.result()
+            except Exception as e:
+                logger.error(f"failed to compute {', '.join(factors)} from {rng[0]} to {rng[1]}: {e}")
+                for factor in factors:
+                    report[factor]["failed"].append(list(rng))
+                continue
+            logger.info(f"computed {', '.join(factors)} from {rng[0]} to {rng[1]} in {seconds:.2f}s")
+            for factor in factors:
+                # a batch's time is shared evenly, its nodes serve all of its factors
+                report[factor]["compute"] += seconds / len(factors)
+                writing[writers[report[factor]["uri"]].submit(factor, data[factor])] = (factor, rng)
+    for future in as_completed(writing):
+        factor, rng = writing[future]
+        try:
+            rows, seconds = future.result()
+        except Exception as e:
+            logger.error(f"failed to write {factor} from {rng[0]} to {rng[1]}: {e}")
+            report[factor]["failed"].append(list(rng))
+            continue
+        report[factor]["rows"] += rows
+        report[factor]["write"] += seconds
+    for writer in writers.values():
+        writer.close()
+
+    for uri, writer in writers.items():
+        record_state(uri, {factor: info["failed"] for factor, info in report.items()
+            if info["uri"] == uri and info["ranges"]})
+    return pd.DataFrame(report).T
+
+def topk_returns(factor: str, date: pd.Timestamp, topk: int, quote: pd.Series) -> float:
+    codes = SNAPSHOTS.topk(factor, FACTOR_INFO[factor]["uri"], date, topk)
+    return float(np.nansum(quote.reindex(codes).to_numpy()) / topk)
 
 @app.route('/returns/<string:factor>')
 def returns(factor: str):
     topk = request.args.get("topk", default=100, type=int)
     ndays = request.args.get("ndays", default=1, type=int)
-    todaystr = datetime.datetime.now().strftime(r'%Y-%m-%d')
-    table = quool.PanelTable(FACTOR_INFO[factor]["uri"])
-    rollback_day = ft.get_trading_days_rollback('/home/data/quotes-day', todaystr, ndays)
-    quotes = ak.stock_zh_a_spot_em().set_index("代码").drop("序号", axis=1)
-    factor_data = ft.get_data(table.path, factor, rollback_day, rollback_day)
-    factor_data = factor_data.squeeze()
-    factor_rank = factor_data.rank(ascending=False)
-    weight = factor_rank[factor_rank < topk]
-    weight.iloc[:] = 1 / topk
-    weight.index = weight.index.str.slice(0, 6)
-    ret = (weight * quotes["涨跌幅"]).sum()
-    return jsonify({factor: ret})
+    rollback_day = ft.get_trading_days_rollback(QUOTES_URI, pd.Timestamp.now().normalize(), ndays)
+    return jsonify({factor: topk_returns(factor, rollback_day, topk, QUOTES.fetch())})
+
+@app.route('/returns')
+def returns_all():
+    topk = request.args.get("topk", default=100, type=int)
+    ndays = request.args.get("ndays", default=1, type=int)
+    factors = request.args.get("factors", default=None, type=str)
+    factors = quool.parse_commastr(factors) if factors else list(FACTOR_INFO)
+    rollback_day = ft.get_trading_days_rollback(QUOTES_URI, pd.Timestamp.now().normalize(), ndays)
+    quote = QUOTES.fetch()
+    return jsonify({factor: topk_returns(factor, rollback_day, topk, quote) for factor in factors})
 
 if __name__ == "__main__":
     todaystr = datetime.datetime.now().strftime(r'%Y-%m-%d')
-    for factor in list(FACTOR_INFO.keys())[-1:]:
-        dump(factor, todaystr, todaystr)
+    report = run_dumps(list(FACTOR_INFO), todaystr, todaystr,
+        max_workers=int(os.environ.get("FACTOR_DUMP_WORKERS", 0)) or None)
+    logger.info(f"dump report\n{report.to_string()}")
@@ -1,6 +1,8 @@
+import barra
 import quool
 import datetime
 import numpy as np
+import chunked
 import factor as ft
 from pathlib import Path
 
@@ -24,6 +26,10 @@ ngroup = 10 # how many groups to divide
 topk = 10 # under development
 commission = 0.005 # commission used in group test
 n_jobs = -1 # how many cpus to use in layering test
+report = None # result backend, None / excel / parquet / feather
+render = 'inline' # figure rendering, inline / background / deferred (needs parquet or feather)
+chunksize = None # trading days per block to stream the history in, None loads it whole
+neutralize = None # barra exposures to regress the factor on, e.g. ["logsize", "momentum_20d"]
 
 today = datetime.datetime.today().strftime(r'%Y%m%d')
 stop = stop or today
@@ -32,27 +38,66 @@ result_path = (Path(result_path) / name / expname).expanduser().resolve()
 result_path.mkdir(exist_ok=True, parents=True)
 logger = quool.Logger("Tester")
 
+def result(stage: str):
+    if report is None:
+        return None
+    return result_path / (f'{stage}.xlsx' if report == 'excel' else stage)
+
+def make_preprocessor(start, stop) -> ft.Preprocessor:
+    preprocessor = ft.Preprocessor() # chunksize / dtype='float32' for full-market panels
+    # preprocessor.replace(0, np.nan)
+    # preprocessor.log()
+    preprocessor.madoutlier(5)
+    if neutralize:
+        preprocessor.neutralize({exposure: getattr(barra, f'get_{exposure}')(start, stop) 
+            for exposure in neutralize})
+    preprocessor.zscore()
+    return preprocessor
+
+def preprocess_block(factor):
+    # exposures are read for the dates of the block only, memory stays bounded
+    if factor.empty:
+        return factor
+    return make_preprocessor(factor.index[0], factor.index[-1])(factor)
+
 logger.info("preparing data")
-price = ft.get_price(price_uri, "open", pool, pool_uri, start, stop)
 benchmark = None
 if pool is not None:
     benchmark = ft.get_data(benchmark_uri, "close", start, stop, pool, None)
-raw_factor = ft.get_data(factor_uri, name, start, stop, pool, pool_uri)
+# the cross section only needs the last days, the whole history is read when not chunked
+window = start if chunksize is None else ft.get_trading_days_rollback(
+    price_uri, stop, max(rebalance + 1, -crossdate))
+price = ft.get_price(price_uri, "open", pool, pool_uri, window, stop)
+raw_factor = ft.get_data(factor_uri, name, window, stop, pool, pool_uri)
 
 logger.info("preprocessing data")
-# factor = ft.replace(raw_factor, 0, np.nan)
-# factor = ft.log(raw_factor)
-factor = ft.madoutlier(raw_factor, 5)
-factor = ft.zscore(factor)
+factor = make_preprocessor(window, stop)(raw_factor)
 
 logger.info("performing cross section test")
 ft.perform_crosssection(factor, price, rebalance, 
-    image=result_path / 'cross-section.png')
+    image=result_path / 'cross-section.png', result=result('cross-section'), 
+    backend=report or 'excel', render=render)
 
-logger.info("performing information coefficiency test")
-ft.perform_inforcoef(factor, price, rebalance, 
-    image=result_path / 'information-coefficient.png')
+if chunksize is not None:
+    logger.info(f"streaming information coefficiency test and backtest in {chunksize} day blocks")
+    del factor, price, raw_factor
+    reader = chunked.read_blocks(factor_uri, name, price_uri, "open", 
+        start, stop, pool, pool_uri, preprocess_block, chunksize)
+    inforcoef, portfolios = chunked.evaluate(reader, chunked.ChunkedInforcoef(rebalance), 
+        chunked.ChunkedBacktest(longshort=-1, topk=100, benchmark=benchmark))
+    ft.report_inforcoef(inforcoef, rebalance, 
+        image=result_path / 'information-coefficient.png', result=result('information-coefficient'), 
+        backend=report or 'excel', render=render)
+    ft.report_backtest(portfolios, longshort=-1, topk=100, 
+        benchmark=benchmark, image=result_path / 'backtest.png', result=result('backtest'), 
+        backend=report or 'excel', render=render)
+else:
+    logger.info("performing information coefficiency test")
+    ft.perform_inforcoef(factor, price, rebalance, 
+        image=result_path / 'information-coefficient.png', result=result('information-coefficient'), 
+        backend=report or 'excel', render=render)
 
-logger.info("performing backtest")
-ft.perform_backtest(factor, price, longshort=-1, topk=100, 
-    benchmark=benchmark, image=result_path / 'backtest.png')
+    logger.info("performing backtest")
+    ft.perform_backtest(factor, price, longshort=-1, topk=100, 
+        benchmark=benchmark, image=result_path / 'backtest.png', result=result('backtest'), 
+        backend=report or 'excel', render=render)
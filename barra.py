@@ -1,49 +1,62 @@
 import factor
+import tracing
+import fundamental
+import rolling
 import numpy as np
 import pandas as pd
 
 
+@tracing.traced()
 def get_logsize(
     start: str, stop: str,
 ) -> pd.DataFrame:
     qtd_uri = '/home/data/quotes-day'
-    shares = factor.get_data(qtd_uri, "circulation_a", start=start, stop=stop)
-    price = factor.get_data(qtd_uri, "close", start=start, stop=stop)
-    adjfactor = factor.get_data(qtd_uri, "adjfactor", start=start, stop=stop)
-    return -np.log(shares * price * adjfactor)
+    panels = factor.load_panels(qtd_uri, "circulation_a, close, adjfactor", start=start, stop=stop)
+    return (-np.log(panels["circulation_a"] * panels["close"] * panels["adjfactor"])).frame('float64')
 
+@tracing.traced()
 def get_momentum_20d(
-    start: str, stop: str,
+    start: str, stop: str, warmup: int = 21,
 ) -> pd.DataFrame:
     qtd_uri = '/home/data/quotes-day'
-    rollback = factor.get_trading_days_rollback(qtd_uri, start, 21)
-    price = factor.get_data(qtd_uri, "close", start=rollback, stop=stop)
-    adjfactor = factor.get_data(qtd_uri, "adjfactor", start=rollback, stop=stop)
-    price *= adjfactor
-    return -(price / price.shift(20) - 1).loc[start:stop]
+    rollback = factor.get_trading_days_rollback(qtd_uri, start, warmup)
+    panels = factor.get_panels(qtd_uri, "close, adjfactor", start=rollback, stop=stop)
+    price = panels["close"] * panels["adjfactor"]
+    return -(price / rolling.ts_delay(price, 20) - 1).loc[start:stop]
 
+@tracing.traced()
 def get_volatility_20d(
-    start: str, stop: str,
+    start: str, stop: str, warmup: int = 22,
 ) -> pd.DataFrame:
     qtd_uri = '/home/data/quotes-day'
-    rollback = factor.get_trading_days_rollback(qtd_uri, start, 22)
-    price = factor.get_data(qtd_uri, "close", start=rollback, stop=stop)
-    adjfactor = factor.get_data(qtd_uri, "adjfactor", start=rollback, stop=stop)
-    price *= adjfactor
-    returns = price / price.shift(1) - 1
-    return -returns.rolling(20).std().loc[start:stop]
+    rollback = factor.get_trading_days_rollback(qtd_uri, start, warmup)
+    panels = factor.get_panels(qtd_uri, "close, adjfactor", start=rollback, stop=stop)
+    price = panels["close"] * panels["adjfactor"]
+    returns = price / rolling.ts_delay(price, 1) - 1
+    return -rolling.ts_std(returns, 20).loc[start:stop]
 
+@tracing.traced()
 def get_ep(
     start: str, stop: str,
 ) -> pd.DataFrame:
     qtd_uri = '/home/data/quotes-day'
-    fin_uri = '/home/data/financial'
-    rollback = factor.get_trading_days_rollback(qtd_uri, start, 250)
-    trading_days = factor.get_trading_days(qtd_uri, rollback, stop)
-    shares = factor.get_data(qtd_uri, "circulation_a", start=start, stop=stop)
-    price = factor.get_data(qtd_uri, "close", start=start, stop=stop)
-    adjfactor = factor.get_data(qtd_uri, "adjfactor", start=start, stop=stop)
-    value = price * adjfactor * shares
-    net_profit = factor.get_data(fin_uri, 'net_profit', start=rollback, stop=stop)
-    net_profit = net_profit.reindex(trading_days).ffill()
-    return (net_profit / value).loc[start:stop]
+    trading_days = factor.get_trading_days(qtd_uri, start, stop)
+    panels = factor.load_panels(qtd_uri, "circulation_a, close, adjfactor", start=start, stop=stop)
+    value = panels["close"] * panels["adjfactor"] * panels["circulation_a"]
+    net_profit = fundamental.load_daily('net_profit', start, stop)['net_profit']
+    return (net_profit.reindex(trading_days) / value).frame('float64')
+
+def register(graph):
+    qtd_uri = '/home/data/quotes-day'
+    graph.field("close", qtd_uri)
+    graph.field("adjfactor", qtd_uri)
+    graph.field("circulation_a", qtd_uri)
+    graph.add("adjclose", lambda close, adjfactor: close * adjfactor, ["close", "adjfactor"])
+    graph.add("market_value", lambda price, shares: price * shares, ["adjclose", "circulation_a"])
+    fundamental.register(graph, "net_profit")
+    graph.add("logsize", lambda value: -np.log(value), ["market_value"])
+    graph.add("momentum_20d", lambda price: 
+        -(price / rolling.ts_delay(price, 20) - 1), ["adjclose"], warmup=21)
+    graph.add("volatility_20d", lambda price: 
+        -rolling.ts_std(price / rolling.ts_delay(price, 1) - 1, 20), ["adjclose"], warmup=22)
+    graph.add("ep", lambda net_profit, value: net_profit / value, ["net_profit_daily", "market_value"])
@@ -0,0 +1,255 @@
+import json
+import time
+import quool
+import shutil
+import argparse
+import platform
+import datetime
+import tracemalloc
+import subprocess
+import highfreq
+import numpy as np
+import pandas as pd
+import factor as ft
+from pathlib import Path
+
+
+def make_panels(
+    ncode: int,
+    nday: int,
+    nan_rate: float = 0.01,
+    suspend_rate: float = 0.01,
+    suspend_days: int = 5,
+    start: str = '2015-01-05',
+    seed: int = 0,
+) -> dict[str, pd.DataFrame]:
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start, periods=nday, name='date')
+    codes = pd.Index([f'{i:06d}.{"XSHE" if i % 2 else "XSHG"}'
+        for i in range(1, ncode + 1)], name='order_book_id')
+
+    returns = rng.normal(0, 0.02, (nday, ncode))
+    close = 10 * np.exp(np.cumsum(returns, axis=0))
+    open = close * (1 + rng.normal(0, 0.005, (nday, ncode)))
+    adjfactor = np.cumprod(np.where(rng.random((nday, ncode)) < 0.002,
+        rng.uniform(1, 1.2, (nday, ncode)), 1), axis=0)
+
+    # suspensions come in runs of about suspend_days, st marks whole codes
+    suspended = np.zeros((nday, ncode), dtype=bool)
+    begin = rng.random((nday, ncode)) < suspend_rate / suspend_days
+    length = rng.geometric(1 / suspend_days, (nday, ncode))
+    for day, code in zip(*np.nonzero(begin)):
+        suspended[day:day + length[day, code], code] = True
+    st = np.broadcast_to(rng.random(ncode) < 0.02, (nday, ncode))
+
+    # a weak reversal signal so group tests have something to find
+    past = np.full((nday, ncode), np.nan)
+    past[20:] = close[20:] / close[:-20] - 1
+    signal = -past + rng.normal(0, 0.1, (nday, ncode))
+    signal[rng.random((nday, ncode)) < nan_rate] = np.nan
+
+    # codes list at different days, nothing exists before listing,
+    # 000001.XSHE is there from the start since the calendar is read from it
+    listing = rng.integers(0, nday // 4 + 1, ncode)
+    listing[0] = 0
+    listed = np.arange(nday)[:, None] >= listing
+    panels = {
+        "open": open, "close": close, "adjfactor": adjfactor,
+        "volume": rng.uniform(1e5, 1e7, (nday, ncode)),
+        "suspended": suspended, "st": st, "factor": signal,
+    }
+    return {name: pd.DataFrame(np.where(listed, values, np.nan)
+        if values.dtype.kind == 'f' else values & listed, index=dates, columns=codes)
+        for name, values in panels.items()}
+
+def make_minutes(
+    close: pd.DataFrame,
+    volume: pd.DataFrame,
+    nday: int = 20,
+    seed: int = 0,
+) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    minutes = pd.timedelta_range('09:31:00', '11:30:00', freq='min').append(
+        pd.timedelta_range('13:01:00', '15:00:00', freq='min'))
+    close, volume = close.iloc[-nday:], volume.iloc[-nday:]
+    stamps = (close.index.to_numpy()[:, None] + minutes.to_numpy()[None, :]).ravel()
+    ncode, nstamp = close.shape[1], len(stamps)
+    # a random walk inside each day that closes at the daily close
+    walk = np.cumsum(rng.normal(0, 0.001, (nday, len(minutes), ncode)), axis=1)
+    price = close.to_numpy()[:, None, :] * np.exp(walk - walk[:, -1:, :])
+    share = rng.dirichlet(np.ones(len(minutes)), (nday, ncode)).transpose(0, 2, 1)
+    bars = pd.DataFrame({
+        "close": price.reshape(nstamp, ncode).T.ravel(),
+        "volume": (volume.to_numpy()[:, None, :] * share).reshape(nstamp, ncode).T.ravel(),
+    }, index=pd.MultiIndex.from_product([close.columns, stamps], names=['order_book_id', 'datetime']))
+    return bars.dropna()
+
+def make_store(
+    root: str | Path,
+    ncode: int,
+    nday: int,
+    minute_days: int = 0,
+    **kwargs,
+) -> dict[str, str]:
+    root = Path(root).expanduser() / f'{ncode}x{nday}'
+    uris = {"quotes": str(root / 'quotes-day'), "factor": str(root / 'factor'),
+        "minute": str(root / 'quotes-min')}
+    params = {"ncode": ncode, "nday": nday, "minute_days": minute_days, **kwargs}
+    marker = root / '.bench.json'
+    if marker.exists() and json.loads(marker.read_text()) == params:
+        return uris
+    shutil.rmtree(root, ignore_errors=True)
+    # quool only opens existing table directories
+    for name in ["quotes", "factor"] + (["minute"] if minute_days else []):
+        Path(uris[name]).mkdir(parents=True)
+
+    panels = make_panels(ncode, nday, **kwargs)
+    quotes = pd.concat({name: panels[name].stack() for name in
+        ["open", "close", "adjfactor", "volume", "suspended", "st"]}, axis=1)
+    quotes = quotes.reorder_levels(['order_book_id', 'date']).sort_index()
+    quotes = quotes[quotes["close"].notna()]
+    quool.PanelTable(uris["quotes"], code_level='order_book_id', date_level='date').add(quotes)
+    ft.save_data(panels["factor"], 'factor', uris["factor"])
+    if minute_days:
+        minutes = make_minutes(panels["close"], panels["volume"], minute_days)
+        quool.PanelTable(uris["minute"], code_level='order_book_id', date_level='datetime').add(minutes)
+    marker.write_text(json.dumps(params))
+    return uris
+
+def stages(uris: dict, rebalance: int = 5, minute_days: int = 0) -> list:
+    # the stages of backtest.py, each reading what the previous ones produced
+    data = {}
+
+    def read_price():
+        ft.panel_cache.clear()
+        data["price"] = ft.get_price(uris["quotes"], "open")
+
+    def read_factor():
+        ft.panel_cache.clear()
+        data["raw"] = ft.get_data(uris["factor"], "factor")
+
+    def preprocess():
+        preprocessor = ft.Preprocessor()
+        preprocessor.madoutlier(5).zscore()
+        data["factor"] = preprocessor(data["raw"])
+
+    def crosssection():
+        ft.perform_crosssection(data["factor"], data["price"], rebalance, image=None)
+
+    def inforcoef():
+        ft.perform_inforcoef(data["factor"], data["price"], rebalance, image=None)
+
+    def backtest():
+        ft.perform_backtest(data["factor"], data["price"], longshort=-1,
+            topk=100, image=None, n_jobs=1)
+
+    def intraday():
+        days = ft.get_calendar(uris["quotes"]).days
+        highfreq.aggregate({"tvp": highfreq.tail_volume_share(30)}, days[-minute_days], 
+            days[-1], uri=uris["minute"], calendar_uri=uris["quotes"], date_level='datetime')
+
+    funcs = [read_price, read_factor, preprocess, crosssection, inforcoef, backtest]
+    return funcs + [intraday] if minute_days else funcs
+
+def measure(func: callable, repeat: int = 1) -> dict:
+    # timings run untraced, the peak comes from one extra traced call
+    seconds = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - begin)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": min(seconds), "peak_mb": peak / 1024 ** 2}
+
+def _commit() -> tuple[str, bool]:
+    cwd = Path(__file__).resolve().parent
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=cwd,
+            capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+            cwd=cwd, capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+    return commit, dirty
+
+def run(
+    sizes: list[tuple[int, int]],
+    root: str | Path = '~/.cache/factor-bench',
+    output: str | Path = '~/.cache/factor-bench/bench-results.jsonl',
+    repeat: int = 3,
+    minute_days: int = 0,
+    nan_rate: float = 0.01,
+    suspend_rate: float = 0.01,
+    rebalance: int = 5,
+) -> pd.DataFrame:
+    commit, dirty = _commit()
+    records = []
+    for ncode, nday in sizes:
+        uris = make_store(root, ncode, nday, minute_days,
+            nan_rate=nan_rate, suspend_rate=suspend_rate)
+        for func in stages(uris, rebalance, minute_days):
+            result = measure(func, repeat)
+            records.append({
+                "commit": commit, "dirty": dirty,
+                "time": datetime.datetime.now().isoformat(timespec='seconds'),
+                "size": f"{ncode}x{nday}", "ncode": ncode, "nday": nday,
+                "stage": func.__name__, **result, "repeat": repeat,
+                "python": platform.python_version(),
+                "numpy": np.__version__, "pandas": pd.__version__,
+            })
+            print(f"{commit}{'+' if dirty else ''} {ncode}x{nday} {func.__name__:>12}: "
+                f"{result['seconds']:9.4f}s {result['peak_mb']:10.1f}MB", flush=True)
+    output = Path(output).expanduser()
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'a') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+    return pd.DataFrame(records)
+
+def compare(
+    base: str,
+    head: str,
+    output: str | Path = '~/.cache/factor-bench/bench-results.jsonl',
+) -> pd.DataFrame:
+    records = pd.read_json(Path(output).expanduser(), lines=True, dtype={"commit": str})
+    # the latest run of each commit counts
+    records = records.sort_values("time").drop_duplicates(
+        ["commit", "size", "stage"], keep='last').set_index(["commit", "size", "stage"])
+    base, head = records.loc[base], records.loc[head]
+    table = pd.concat([base["seconds"], head["seconds"], head["seconds"] / base["seconds"],
+        base["peak_mb"], head["peak_mb"], head["peak_mb"] / base["peak_mb"]], axis=1,
+        keys=["base_s", "head_s", "time_ratio", "base_mb", "head_mb", "memory_ratio"])
+    return table.dropna(how='all')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark backtest stages on synthetic panels")
+    commands = parser.add_subparsers(dest="command", required=True)
+    runner = commands.add_parser("run")
+    runner.add_argument("--sizes", default="500x250,2000x1000,5000x2500",
+        help="comma separated NCODExNDAY")
+    runner.add_argument("--root", default="~/.cache/factor-bench")
+    runner.add_argument("--output", default="~/.cache/factor-bench/bench-results.jsonl")
+    runner.add_argument("--repeat", type=int, default=3)
+    runner.add_argument("--minute-days", type=int, default=0)
+    runner.add_argument("--nan-rate", type=float, default=0.01)
+    runner.add_argument("--suspend-rate", type=float, default=0.01)
+    runner.add_argument("--rebalance", type=int, default=5)
+    comparer = commands.add_parser("compare")
+    comparer.add_argument("base")
+    comparer.add_argument("head")
+    comparer.add_argument("--output", default="~/.cache/factor-bench/bench-results.jsonl")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        sizes = [tuple(int(n) for n in size.split('x')) for size in args.sizes.split(',')]
+        run(sizes, args.root, args.output, args.repeat, args.minute_days,
+            args.nan_rate, args.suspend_rate, args.rebalance)
+    else:
+        pd.set_option("display.width", 200)
+        print(compare(args.base, args.head, args.output).round(4).to_string())
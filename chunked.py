@@ -0,0 +1,172 @@
+import tracing
+import numpy as np
+import pandas as pd
+import factor as ft
+
+
+def blocks(
+    uri: str,
+    start: str | pd.Timestamp = None,
+    stop: str | pd.Timestamp = None,
+    chunksize: int = 250,
+) -> list[tuple[pd.Timestamp, pd.Timestamp]]:
+    # chunksize trading days per block, the blocks tile [start, stop] without gaps
+    days = ft.get_calendar(uri).range(start, stop)
+    if not len(days):
+        return []
+    starts = list(days[::chunksize])
+    starts[0] = pd.Timestamp(start) if start is not None else starts[0]
+    stops = [day - pd.Timedelta(days=1) for day in starts[1:]]
+    stops.append(pd.Timestamp(stop) if stop is not None else days[-1])
+    return list(zip(starts, stops))
+
+def read_blocks(
+    factor_uri: str,
+    name: str,
+    price_uri: str,
+    ptype: str = 'open',
+    start: str | pd.Timestamp = None,
+    stop: str | pd.Timestamp = None,
+    pool: str = None,
+    pool_uri: str = None,
+    preprocessor: callable = None,
+    chunksize: int = 250,
+):
+    # positions and forward returns run over block boundaries, so prices are read
+    # for every code that is a member anywhere in the range, like a whole read does
+    codes, _ = ft._read_pool(pool, pool_uri, start, stop)
+    codes = None if codes is None else list(codes)
+    # blocks bypass the panel cache, otherwise the whole history piles up there
+    for bstart, bstop in blocks(price_uri, start, stop, chunksize):
+        with tracing.span('block', start=str(bstart.date()), stop=str(bstop.date())):
+            factor = ft.get_data(factor_uri, name, bstart, bstop, pool, pool_uri, cache=False)
+            if preprocessor is not None:
+                factor = preprocessor(factor)
+            price = ft.get_price(price_uri, ptype, codes, None, bstart, bstop, cache=False)
+        yield factor, price
+
+
+class ChunkedInforcoef:
+
+    def __init__(self, rebalance: int = 5, method: str = 'pearson'):
+        self.rebalance = rebalance
+        self.method = method
+        self.parts = []
+        # factor dates still waiting for their future price, and the prices they need
+        self.factor = None
+        self.price = None
+
+    def update(self, factor: pd.DataFrame, price: pd.DataFrame):
+        if self.factor is not None:
+            factor = pd.concat([self.factor, factor])
+            price = pd.concat([self.price, price])
+        future_returns = price.shift(-self.rebalance) / price - 1
+        ready = len(price) - self.rebalance
+        if ready > 0:
+            done = factor.index <= price.index[ready - 1]
+            scored, future_returns = factor.loc[done].align(
+                future_returns.iloc[:ready], join='inner')
+            if self.method in ('pearson', 'spearman'):
+                self.parts.append(pd.Series(ft._rowcorr(scored.to_numpy(dtype='float64'),
+                    future_returns.to_numpy(dtype='float64'), self.method), index=scored.index))
+            else:
+                self.parts.append(scored.corrwith(future_returns, axis=1, method=self.method))
+            factor = factor.loc[~done]
+        self.factor = factor
+        self.price = price.iloc[max(ready, 0):]
+
+    def finish(self) -> pd.Series:
+        # dates left pending never see a full horizon, in memory they come out nan
+        if not self.parts:
+            return pd.Series(dtype='float64')
+        return pd.concat(self.parts).dropna()
+
+
+class ChunkedBacktest:
+
+    def __init__(
+        self,
+        longshort: int = 1,
+        topk: int = 100,
+        benchmark: pd.Series = None,
+        delay: int = 1,
+        ngroup: int = 5,
+        commission: float = 0.002,
+    ):
+        self.longshort = longshort
+        self.topk = topk
+        self.benchmark = benchmark
+        self.delay = delay
+        self.ngroup = ngroup
+        self.commission = commission
+        self.returns = []
+        self.turnover = []
+        # positions formed in the last delay + 1 dates are still to be booked or
+        # traded against, the last price row gives the first daily return of a block
+        self.factor = None
+        self.price = None
+
+    def update(self, factor: pd.DataFrame, price: pd.DataFrame):
+        carry = 0
+        if self.factor is not None:
+            carry = len(self.factor)
+            factor = pd.concat([self.factor, factor])
+            price = pd.concat([self.price, price])
+        returns = price.pct_change(fill_method=None).reindex(
+            index=factor.index, columns=factor.columns).fillna(0).to_numpy()
+        low, high = ft._rank(factor.to_numpy(dtype='float64'))
+        labels = np.stack([ft._qcut_labels(low, self.ngroup),
+            ft._topk_labels(low, high, self.longshort, self.topk, self.ngroup + 1)])
+        del low, high
+        portfolio_returns, portfolio_turnover = ft._simulate_labels(
+            labels, self.ngroup + 1, returns, self.delay, self.commission)
+        self.returns.append(pd.DataFrame(portfolio_returns[carry:], index=factor.index[carry:]))
+        self.turnover.append(pd.DataFrame(portfolio_turnover[carry:], index=factor.index[carry:]))
+        self.factor = factor.iloc[-(self.delay + 1):]
+        self.price = price.iloc[-1:]
+
+    def finish(self) -> dict:
+        returns = pd.concat(self.returns)
+        turnover = pd.concat(self.turnover)
+        return ft._portfolios(returns.to_numpy(), turnover.to_numpy(),
+            returns.index, self.ngroup, self.benchmark)
+
+
+@tracing.traced()
+def evaluate(reader, *states) -> list:
+    # one pass over the blocks feeds every evaluation
+    for factor, price in reader:
+        for state in states:
+            state.update(factor, price)
+        del factor, price
+    return [state.finish() for state in states]
+
+def perform_inforcoef(
+    reader,
+    rebalance: int = 5,
+    method: str = 'pearson',
+    image: str | bool = True,
+    result: str = None,
+    backend: str = 'excel',
+    render: str = 'inline',
+) -> pd.Series:
+    inforcoef, = evaluate(reader, ChunkedInforcoef(rebalance, method))
+    return ft.report_inforcoef(inforcoef, rebalance, method, image, result, backend, render)
+
+def perform_backtest(
+    reader,
+    longshort: int = 1,
+    topk: int = 100,
+    benchmark: pd.Series = None,
+    delay: int = 1,
+    ngroup: int = 5,
+    commission: float = 0.002,
+    image: str | bool = True,
+    result: str = None,
+    backend: str = 'excel',
+    render: str = 'inline',
+) -> dict:
+    portfolios, = evaluate(reader, ChunkedBacktest(
+        longshort, topk, benchmark, delay, ngroup, commission))
+    return ft.report_backtest(portfolios, longshort, topk, benchmark, delay,
+        ngroup, commission, image, result, backend, render)
@@ -1,13 +1,270 @@
 __version__ = "0.3.1"
 
 
+import sys
+import time
+import json
 import quool
+import warnings
+import threading
+import subprocess
 import numpy as np
+import tracing
+import regression
 import pandas as pd
 import matplotlib.pyplot as plt
+from panel import Panel
+from pathlib import Path
+from collections import OrderedDict
+from multiprocessing import shared_memory, resource_tracker
 from joblib import Parallel, delayed
 
 
+class PanelCache:
+
+    def __init__(self, maxbytes: int = 2 * 1024 ** 3, ttl: float = 60):
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.loaded_bytes = 0
+
+    @property
+    def nbytes(self) -> int:
+        return sum(entry["nbytes"] for entry in self._entries.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "nbytes": self.nbytes,
+                "maxbytes": self.maxbytes,
+                "loaded_bytes": self.loaded_bytes,
+            }
+
+    def clear(self, uri: str | Path = None):
+        with self._lock:
+            if uri is None:
+                self._entries.clear()
+                return
+            uri = _normuri(uri)
+            for key in [key for key in self._entries if key[1] == uri]:
+                del self._entries[key]
+
+    def _load(self, loader: callable, start: pd.Timestamp, stop: pd.Timestamp):
+        data = loader(start, stop)
+        with self._lock:
+            self.loaded_bytes += _nbytes(data)
+        return data
+
+    def fetch(
+        self,
+        key: tuple,
+        start: str | pd.Timestamp,
+        stop: str | pd.Timestamp,
+        loader: callable,
+        date_level: str | int = 1,
+        dropna: bool = False,
+        sources: list = (),
+    ) -> pd.DataFrame | pd.Series:
+        start = None if start is None else pd.to_datetime(start)
+        stop = None if stop is None else pd.to_datetime(stop)
+        with self._lock:
+            entry = self._entries.get(key)
+        # other processes write the tables too, so every ttl seconds an entry is 
+        # checked against the fragments of the tables it was read from
+        fingerprint = None
+        if entry is not None and time.monotonic() - entry["checked"] > self.ttl:
+            fingerprint = _scan_sources(sources)
+            with self._lock:
+                if np.array_equal(fingerprint, entry["fingerprint"]):
+                    entry["checked"] = time.monotonic()
+                else:
+                    if self._entries.get(key) is entry:
+                        del self._entries[key]
+                    entry = None
+
+        with self._lock:
+            if entry is not None and _covers(entry["start"], entry["stop"], start, stop):
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return _slice_dates(entry["data"], start, stop, date_level, dropna)
+            self.misses += 1
+
+        # fragments are scanned before reading, a write in between is caught next check
+        if fingerprint is None:
+            fingerprint = _scan_sources(sources)
+        if entry is not None and not np.array_equal(fingerprint, entry["fingerprint"]):
+            entry = None
+        if entry is not None and _overlaps(entry["start"], entry["stop"], start, stop):
+            # only read the edges the cached range does not cover yet
+            pieces = [entry["data"]]
+            if entry["start"] is not None and (start is None or start < entry["start"]):
+                head = self._load(loader, start, entry["start"])
+                dates = _date_values(head, date_level)
+                pieces.insert(0, head.loc[dates < entry["start"]])
+            if entry["stop"] is not None and (stop is None or stop > entry["stop"]):
+                tail = self._load(loader, entry["stop"], stop)
+                dates = _date_values(tail, date_level)
+                pieces.append(tail.loc[dates > entry["stop"]])
+            data = pd.concat(pieces, axis=0).sort_index()
+            merged_start = None if start is None or entry["start"] is None \
+                else min(start, entry["start"])
+            merged_stop = None if stop is None or entry["stop"] is None \
+                else max(stop, entry["stop"])
+        else:
+            data = self._load(loader, start, stop)
+            merged_start, merged_stop = start, stop
+
+        nbytes = _nbytes(data)
+        with self._lock:
+            self._entries.pop(key, None)
+            if nbytes <= self.maxbytes:
+                self._entries[key] = {"data": data, "start": merged_start, "stop": merged_stop, 
+                    "nbytes": nbytes, "fingerprint": fingerprint, "checked": time.monotonic()}
+                while self.nbytes > self.maxbytes:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return _slice_dates(data, start, stop, date_level, dropna)
+
+def _normuri(uri: str | Path) -> str:
+    return str(Path(uri).expanduser().resolve())
+
+def _hashable(value):
+    if isinstance(value, (list, tuple, pd.Index, np.ndarray)):
+        return tuple(value)
+    return value
+
+def _sources(datauri: str, pooluri: str = None) -> list[str]:
+    # pool memberships are read from a table of their own
+    return [_normuri(uri) for uri in (datauri, pooluri) if uri]
+
+def _nbytes(data: pd.DataFrame | pd.Series) -> int:
+    return int(np.sum(data.memory_usage(index=True)))
+
+def _covers(cstart, cstop, start, stop) -> bool:
+    return ((cstart is None or (start is not None and cstart <= start))
+        and (cstop is None or (stop is not None and cstop >= stop)))
+
+def _overlaps(cstart, cstop, start, stop) -> bool:
+    return ((cstart is None or stop is None or cstart <= stop)
+        and (cstop is None or start is None or cstop >= start))
+
+def _date_values(data: pd.DataFrame | pd.Series, date_level: str | int) -> pd.Index:
+    if data.index.nlevels == 1:
+        return data.index
+    return data.index.get_level_values(date_level)
+
+def _slice_dates(
+    data: pd.DataFrame | pd.Series,
+    start: pd.Timestamp,
+    stop: pd.Timestamp,
+    date_level: str | int,
+    dropna: bool = False,
+) -> pd.DataFrame | pd.Series:
+    dates = _date_values(data, date_level)
+    mask = np.ones(len(dates), dtype=bool)
+    if start is not None:
+        mask &= dates >= start
+    if stop is not None:
+        mask &= dates <= stop
+    data = data.loc[mask]
+    # a wider cached read may carry codes that have no value in the narrower range
+    if dropna and isinstance(data, pd.DataFrame) and data.index.nlevels == 1:
+        data = data.dropna(axis=1, how='all')
+    return data
+
+panel_cache = PanelCache()
+tracing.register_counter("cache_hits", lambda: panel_cache.hits)
+tracing.register_counter("cache_misses", lambda: panel_cache.misses)
+tracing.register_counter("bytes_read", lambda: panel_cache.loaded_bytes)
+
+
+_attach_lock = threading.Lock()
+
+class SharedPanel:
+
+    def __init__(self, data: pd.DataFrame):
+        values = data.to_numpy()
+        if values.dtype == object:
+            raise TypeError("only panels of a single numeric dtype can be shared")
+        self._shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        self._owner = True
+        self.name = self._shm.name
+        self.shape = values.shape
+        self.dtype = values.dtype
+        self.index = data.index
+        self.columns = data.columns
+        np.ndarray(self.shape, self.dtype, buffer=self._shm.buf)[:] = values
+
+    @classmethod
+    def attach(
+        cls, 
+        name: str, 
+        shape: tuple, 
+        dtype: str, 
+        index: pd.Index, 
+        columns: pd.Index,
+    ) -> 'SharedPanel':
+        panel = cls.__new__(cls)
+        try:
+            panel._shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # before python 3.13 attaching registers the block with the worker's 
+            # resource tracker, which may unlink it or report a leak when a loky 
+            # worker exits; unregistering afterwards breaks a tracker shared with 
+            # the creator, so the registration is skipped instead
+            with _attach_lock:
+                register = resource_tracker.register
+                resource_tracker.register = lambda name, rtype: None
+                try:
+                    panel._shm = shared_memory.SharedMemory(name=name)
+                finally:
+                    resource_tracker.register = register
+        panel._owner = False
+        panel.name = name
+        panel.shape = shape
+        panel.dtype = np.dtype(dtype)
+        panel.index = index
+        panel.columns = columns
+        return panel
+
+    def __reduce__(self):
+        # workers only receive the block name and the axes
+        return (SharedPanel.attach, (self.name, self.shape, 
+            self.dtype.str, self.index, self.columns))
+
+    def frame(self) -> pd.DataFrame:
+        # a closed block has no buffer, numpy would silently hand out fresh memory
+        if self._shm.buf is None:
+            raise ValueError(f"shared panel {self.name} is closed")
+        values = np.ndarray(self.shape, self.dtype, buffer=self._shm.buf)
+        return pd.DataFrame(values, index=self.index, columns=self.columns, copy=False)
+
+    def close(self):
+        try:
+            self._shm.close()
+        except BufferError:
+            # a frame view is still alive, the mapping goes away with it
+            pass
+        if self._owner:
+            self._shm.unlink()
+            self._owner = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+@tracing.traced()
 def get_data(
     datauri: str,
     field: str | list,
@@ -18,47 +275,447 @@ def get_data(
     dropna: bool = False,
     code_level: str | int = 0,
     date_level: str | int = 1,
+    cache: bool = True,
 ):
     field = quool.parse_commastr(field)
-    data_table = quool.PanelTable(datauri, code_level=code_level, date_level=date_level)
-    if pooluri:
-        pool_table = quool.PanelTable(pooluri, code_level=code_level, date_level=date_level)
+    if not cache:
+        return _read_data(datauri, field, start, stop, 
+            pool, pooluri, dropna, code_level, date_level)
+    key = ("data", _normuri(datauri), tuple(field), _hashable(pool), 
+        pooluri and _normuri(pooluri), dropna, code_level, date_level)
+    return panel_cache.fetch(key, start, stop, 
+        lambda start, stop: _read_data(datauri, field, start, stop, 
+            pool, pooluri, dropna, code_level, date_level),
+        date_level=date_level, dropna=dropna, sources=_sources(datauri, pooluri))
 
-    code = None
-    if pool and pooluri:
-        pool_index = pool_table.read(pool, start=start, stop=stop).dropna().index
-        code = pool_index.get_level_values(code_level)
-    elif pool and not pooluri:
-        code = pool
+def _read_data(
+    datauri: str,
+    field: list,
+    start: str | pd.Timestamp = None,
+    stop: str | pd.Timestamp = None,
+    pool: str = None,
+    pooluri: str = None,
+    dropna: bool = False,
+    code_level: str | int = 0,
+    date_level: str | int = 1,
+):
+    data_table = quool.PanelTable(datauri, code_level=code_level, date_level=date_level)
+    code, pool_index = _read_pool(pool, pooluri, start, stop, code_level, date_level)
     
-    data = data_table.read(field, code=code, start=start, stop=stop)
+    with tracing.span('read', uri=str(datauri)) as span:
+        data = data_table.read(field, code=code, start=start, stop=stop)
+        if span is not None:
+            span["attrs"].update(tracing.sizeof(data))
     if len(field) > 1:
         return data
     
     data = data[field[0]]
     if dropna:
         data = data.dropna()
+    with tracing.span('unstack'):
+        data = data.unstack(level=code_level)
+    if pool_index is not None:
+        data = _apply_pool(data, pool_index)
+    return data
+
+def _read_pool(
+    pool: str | list,
+    pooluri: str,
+    start: str | pd.Timestamp = None,
+    stop: str | pd.Timestamp = None,
+    code_level: str | int = 0,
+    date_level: str | int = 1,
+) -> tuple[pd.Index, list['PoolIndex']]:
     if pool and pooluri:
-        data = data.loc[data.index.isin(pool_index)]
-    data = data.unstack(level=code_level)
+        # a code is in several pools only where it is a member of each
+        pool_index = [get_pool_index(pooluri, name, code_level, date_level) 
+            for name in quool.parse_commastr(pool)]
+        code = pool_index[0].members(start, stop)
+        for index in pool_index[1:]:
+            code = code.intersection(index.members(start, stop))
+        return code, pool_index
+    elif pool and not pooluri:
+        return pool, None
+    return None, None
+
+def _apply_pool(data: pd.DataFrame, pool_index: list['PoolIndex']) -> pd.DataFrame:
+    # codes sit on the last column level of an unstacked panel
+    with tracing.span('pool'):
+        codes = data.columns.get_level_values(-1)
+        mask = pool_index[0].mask(data.index, codes)
+        for index in pool_index[1:]:
+            mask &= index.mask(data.index, codes)
+        # dates and codes without any membership are dropped like the long filter did
+        return data.where(mask).iloc[mask.any(axis=1), mask.any(axis=0)]
+
+@tracing.traced()
+def get_panels(
+    datauri: str,
+    field: str | list,
+    start: str | pd.Timestamp = None,
+    stop: str | pd.Timestamp = None,
+    pool: str = None,
+    pooluri: str = None,
+    dropna: bool = False,
+    code_level: str | int = 0,
+    date_level: str | int = 1,
+    cache: bool = True,
+) -> dict[str, pd.DataFrame]:
+    field = quool.parse_commastr(field)
+    data = _fetch_panels(datauri, field, start, stop, pool, pooluri, 
+        dropna, code_level, date_level, cache)
+    # every field shares the very same index and columns objects
+    index = data.index
+    columns = data[field[0]].columns
+    return {f: pd.DataFrame(data[f].reindex(columns=columns).to_numpy(), 
+        index=index, columns=columns, copy=False) for f in field}
+
+@tracing.traced()
+def load_panels(
+    datauri: str,
+    field: str | list,
+    start: str | pd.Timestamp = None,
+    stop: str | pd.Timestamp = None,
+    pool: str = None,
+    pooluri: str = None,
+    dropna: bool = False,
+    code_level: str | int = 0,
+    date_level: str | int = 1,
+    cache: bool = True,
+    dtype: str | np.dtype = 'float32',
+) -> dict[str, Panel]:
+    field = quool.parse_commastr(field)
+    data = _fetch_panels(datauri, field, start, stop, pool, pooluri, 
+        dropna, code_level, date_level, cache)
+    index = data.index
+    columns = data[field[0]].columns
+    return {f: Panel(data[f].reindex(columns=columns).to_numpy(dtype=dtype), 
+        index, columns) for f in field}
+
+def _fetch_panels(
+    datauri: str,
+    field: list,
+    start: str | pd.Timestamp = None,
+    stop: str | pd.Timestamp = None,
+    pool: str = None,
+    pooluri: str = None,
+    dropna: bool = False,
+    code_level: str | int = 0,
+    date_level: str | int = 1,
+    cache: bool = True,
+) -> pd.DataFrame:
+    loader = lambda start, stop: _read_panels(datauri, field, start, stop, 
+        pool, pooluri, dropna, code_level, date_level)
+    if not cache:
+        return loader(start, stop)
+    key = ("panels", _normuri(datauri), tuple(field), _hashable(pool), 
+        pooluri and _normuri(pooluri), dropna, code_level, date_level)
+    return panel_cache.fetch(key, start, stop, loader, date_level=date_level,
+        sources=_sources(datauri, pooluri))
+
+def _read_panels(
+    datauri: str,
+    field: list,
+    start: str | pd.Timestamp = None,
+    stop: str | pd.Timestamp = None,
+    pool: str = None,
+    pooluri: str = None,
+    dropna: bool = False,
+    code_level: str | int = 0,
+    date_level: str | int = 1,
+) -> pd.DataFrame:
+    data_table = quool.PanelTable(datauri, code_level=code_level, date_level=date_level)
+    code, pool_index = _read_pool(pool, pooluri, start, stop, code_level, date_level)
+    with tracing.span('read', uri=str(datauri)) as span:
+        data = data_table.read(field, code=code, start=start, stop=stop)
+        if span is not None:
+            span["attrs"].update(tracing.sizeof(data))
+    if dropna:
+        data = data.dropna(how='all')
+    with tracing.span('unstack'):
+        data = data.unstack(level=code_level)
+    if pool_index is not None:
+        data = _apply_pool(data, pool_index)
     return data
 
+class TradingCalendar:
+
+    def __init__(
+        self,
+        uri: str | Path,
+        code: str = '000001.XSHE',
+        field: str = 'close',
+        ttl: float = 60,
+    ):
+        self.uri = _normuri(uri)
+        self.code = code
+        self.field = field
+        self.ttl = ttl
+        self.path = Path(self.uri) / '.calendar.npz'
+        self._days = pd.DatetimeIndex([])
+        self._values = self._days.values
+        self._fingerprint = None
+        self._checked = 0
+        self._lock = threading.RLock()
+        self._load()
+        self.refresh()
+
+    @property
+    def days(self) -> pd.DatetimeIndex:
+        return self._days
+
+    def __len__(self) -> int:
+        return len(self._days)
+
+    def __contains__(self, date: str | pd.Timestamp) -> bool:
+        pos = self._search(date, 'left')
+        return pos < len(self._days) and self._values[pos] == np.datetime64(pd.Timestamp(date))
+
+    def _search(self, date: str | pd.Timestamp, side: str) -> int:
+        # pd.Timestamp parsing is two orders of magnitude faster than pd.to_datetime
+        return int(self._values.searchsorted(np.datetime64(pd.Timestamp(date)), side))
+
+    def _scan(self) -> np.ndarray:
+        return _scan_fragments(self.uri)
+
+    def _read(self, start: pd.Timestamp = None) -> pd.DatetimeIndex:
+        table = quool.PanelTable(self.uri)
+        data = table.read(self.field, code=self.code, start=start)
+        return pd.DatetimeIndex(data.index.get_level_values(1).unique()).sort_values()
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as sidecar:
+                self._days = pd.DatetimeIndex(sidecar["days"], name=str(sidecar["name"]) or None)
+                self._fingerprint = sidecar["fingerprint"]
+                self._values = self._days.values
+        except (OSError, KeyError, ValueError):
+            self._days, self._fingerprint = pd.DatetimeIndex([]), None
+            self._values = self._days.values
+
+    def _dump(self):
+        try:
+            tmp = self.path.with_name(self.path.stem + '.tmp.npz')
+            np.savez(tmp, days=self._days.values.astype('datetime64[ns]'),
+                fingerprint=self._fingerprint, name=np.array(self._days.name or ''))
+            tmp.replace(self.path)
+        except OSError:
+            pass
+
+    def refresh(self, force: bool = False):
+        with self._lock:
+            self._checked = time.monotonic()
+            fingerprint = self._scan()
+            if not force and self._fingerprint is not None \
+                and np.array_equal(fingerprint, self._fingerprint):
+                return
+            if force or self._fingerprint is None or not len(self._days) \
+                or fingerprint[0] < self._fingerprint[0]:
+                self._days = self._read()
+            else:
+                new = self._read(start=self._days[-1])
+                self._days = self._days.append(new[new > self._days[-1]])
+            self._values = self._days.values
+            self._fingerprint = fingerprint
+            self._dump()
+
+    def expired(self) -> bool:
+        return time.monotonic() - self._checked > self.ttl
+
+    def range(
+        self,
+        start: str | pd.Timestamp = None,
+        stop: str | pd.Timestamp = None,
+    ) -> pd.DatetimeIndex:
+        left = 0 if start is None else self._search(start, 'left')
+        right = len(self._days) if stop is None else self._search(stop, 'right')
+        return self._days[left:right]
+
+    def rollback(self, date: str | pd.Timestamp, shift: int = 1) -> pd.Timestamp:
+        pos = self._search(date, 'right') - shift
+        if pos < 0:
+            raise IndexError(f"less than {shift} trading days before {date}")
+        return self._days[pos]
+
+    def next(self, date: str | pd.Timestamp, shift: int = 1) -> pd.Timestamp:
+        pos = self._search(date, 'right') + shift - 1
+        if pos >= len(self._days):
+            raise IndexError(f"less than {shift} trading days after {date}")
+        return self._days[pos]
+
+    def shift(self, date: str | pd.Timestamp, n: int) -> pd.Timestamp:
+        pos = self._search(date, 'right') - 1 + n
+        if pos < 0 or pos >= len(self._days):
+            raise IndexError(f"shifting {date} by {n} trading days is out of range")
+        return self._days[pos]
+
+def _scan_fragments(uri: str) -> np.ndarray:
+    # parquet fragments only ever grow when new rows are written
+    stats = [f.stat() for f in Path(uri).glob('**/*.parquet')]
+    return np.array([
+        len(stats),
+        max((st.st_mtime_ns for st in stats), default=0),
+        sum(st.st_size for st in stats),
+    ], dtype='int64')
+
+def _scan_sources(uris: list) -> np.ndarray:
+    return np.concatenate([_scan_fragments(uri) for uri in uris] or [np.zeros(0, dtype='int64')])
+
+_calendars = {}
+_calendars_lock = threading.Lock()
+
+def get_calendar(uri: str | Path, ttl: float = 60) -> TradingCalendar:
+    key = _normuri(uri)
+    with _calendars_lock:
+        calendar = _calendars.get(key)
+        if calendar is None:
+            calendar = _calendars[key] = TradingCalendar(key, ttl=ttl)
+            return calendar
+    if calendar.expired():
+        calendar.refresh()
+    return calendar
+
+class PoolIndex:
+
+    def __init__(
+        self,
+        uri: str | Path,
+        pool: str,
+        code_level: str | int = 0,
+        date_level: str | int = 1,
+        ttl: float = 60,
+    ):
+        self.uri = _normuri(uri)
+        self.pool = pool
+        self.code_level = code_level
+        self.date_level = date_level
+        self.ttl = ttl
+        # a dot directory next to the pool fragments, the table reader skips it
+        self.path = Path(self.uri) / '.membership' / f'{pool}.npz'
+        self.dates = pd.DatetimeIndex([])
+        self.codes = pd.Index([])
+        self.matrix = np.zeros((0, 0), dtype=bool)
+        self._fingerprint = None
+        self._checked = 0
+        self._lock = threading.RLock()
+        self._load()
+        self.refresh()
+
+    def __repr__(self) -> str:
+        return f"PoolIndex({self.pool}, {len(self.dates)} dates x {len(self.codes)} codes)"
+
+    def _read(self, start: pd.Timestamp = None) -> pd.MultiIndex:
+        table = quool.PanelTable(self.uri, code_level=self.code_level, date_level=self.date_level)
+        return table.read(self.pool, start=start)[self.pool].dropna().index
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as sidecar:
+                self.dates = pd.DatetimeIndex(sidecar["dates"])
+                self.codes = pd.Index(sidecar["codes"].astype(object))
+                self.matrix = np.unpackbits(sidecar["bits"], axis=1, 
+                    count=len(self.codes)).astype(bool)
+                self._fingerprint = sidecar["fingerprint"]
+        except (OSError, KeyError, ValueError):
+            self.dates, self.codes = pd.DatetimeIndex([]), pd.Index([])
+            self.matrix, self._fingerprint = np.zeros((0, 0), dtype=bool), None
+
+    def _dump(self):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.stem + '.tmp.npz')
+            np.savez(tmp, dates=self.dates.values.astype('datetime64[ns]'),
+                codes=self.codes.to_numpy(dtype=str), bits=np.packbits(self.matrix, axis=1),
+                fingerprint=self._fingerprint)
+            tmp.replace(self.path)
+        except OSError:
+            pass
+
+    def _build(self, members: pd.MultiIndex, keep: int):
+        # the first keep rows stay, members rebuild every row after them
+        codes = members.get_level_values(self.code_level)
+        dates = pd.DatetimeIndex(members.get_level_values(self.date_level))
+        new = pd.DatetimeIndex(dates.unique()).sort_values()
+        columns = self.codes.append(pd.Index(codes.unique()).difference(self.codes).sort_values())
+        matrix = np.zeros((keep + len(new), len(columns)), dtype=bool)
+        matrix[:keep, :len(self.codes)] = self.matrix[:keep]
+        matrix[keep + new.get_indexer(dates), columns.get_indexer(codes)] = True
+        self.dates = self.dates[:keep].append(new)
+        self.codes = columns
+        self.matrix = matrix
+
+    def refresh(self, force: bool = False):
+        with self._lock:
+            self._checked = time.monotonic()
+            fingerprint = _scan_fragments(self.uri)
+            if not force and self._fingerprint is not None \
+                and np.array_equal(fingerprint, self._fingerprint):
+                return
+            if force or self._fingerprint is None or not len(self.dates) \
+                or fingerprint[0] < self._fingerprint[0]:
+                self.dates, self.codes = pd.DatetimeIndex([]), pd.Index([])
+                self.matrix = np.zeros((0, 0), dtype=bool)
+                self._build(self._read(), 0)
+            else:
+                # constituents are appended, the last known date is read again
+                self._build(self._read(start=self.dates[-1]), len(self.dates) - 1)
+            self._fingerprint = fingerprint
+            self._dump()
+
+    def expired(self) -> bool:
+        return time.monotonic() - self._checked > self.ttl
+
+    def members(
+        self,
+        start: str | pd.Timestamp = None,
+        stop: str | pd.Timestamp = None,
+    ) -> pd.Index:
+        rows = self.dates.slice_indexer(start, stop)
+        return self.codes[self.matrix[rows].any(axis=0)]
+
+    def mask(self, index: pd.Index, columns: pd.Index) -> np.ndarray:
+        rows = self.dates.get_indexer(index)
+        cols = self.codes.get_indexer(columns)
+        mask = self.matrix[np.maximum(rows, 0)][:, np.maximum(cols, 0)]
+        mask &= (rows >= 0)[:, None] & (cols >= 0)[None, :]
+        return mask
+
+_pool_indexes = {}
+
+def get_pool_index(
+    uri: str | Path,
+    pool: str,
+    code_level: str | int = 0,
+    date_level: str | int = 1,
+    ttl: float = 60,
+) -> PoolIndex:
+    key = (_normuri(uri), pool, code_level, date_level)
+    with _calendars_lock:
+        index = _pool_indexes.get(key)
+        if index is None:
+            index = _pool_indexes[key] = PoolIndex(uri, pool, code_level, date_level, ttl)
+            return index
+    if index.expired():
+        index.refresh()
+    return index
+
+@tracing.traced()
 def get_trading_days(
     uri: str, 
     start: str, 
     stop: str, 
     field: str = 'close',
 ) -> pd.DatetimeIndex:
-    table = quool.PanelTable(uri)
-    field = table.read('close', code='000001.XSHE', start=start, stop=stop)
-    trading_days = field.droplevel(0).index
-    return trading_days
+    return get_calendar(uri).range(start, stop)
 
-def get_trading_days_rollback(uri: str, date: str, shift: int) -> pd.DatetimeIndex:
-    trading_days = get_trading_days(uri, start=None, stop=date)
-    rollback = trading_days[trading_days <= date][-shift]
-    return rollback
+def get_trading_days_rollback(uri: str, date: str, shift: int) -> pd.Timestamp:
+    return get_calendar(uri).rollback(date, shift)
 
+@tracing.traced()
 def get_price(
     uri: str,
     ptype: str | list,
@@ -70,6 +727,7 @@ def get_price(
     adjust: bool = True,
     code_level: int | str = 0,
     date_level: int | str = 1,
+    cache: bool = True,
 ) -> pd.DataFrame:
     ptype = quool.parse_commastr(ptype)
     if filter:
@@ -79,7 +737,7 @@ def get_price(
     data = get_data(datauri=uri, field=names, 
         pool=pool, pooluri=pooluri,
         start=start, stop=stop, dropna=False,
-        code_level=code_level, date_level=date_level,
+        code_level=code_level, date_level=date_level, cache=cache,
     )
     if filter:
         stsus = (data['st'] | data['suspended']).replace(np.nan, True)
@@ -90,6 +748,7 @@ def get_price(
         return data[ptype]
     return data[ptype[0]].unstack(level=code_level)
 
+@tracing.traced()
 def save_data(
     data: pd.DataFrame | pd.Series, 
     name: str, 
@@ -106,6 +765,59 @@ def save_data(
         table.update(data)
     else:
         table.add(data)
+    panel_cache.clear(uri)
+
+@tracing.traced()
+def save_panels(
+    data: dict[str, pd.DataFrame | pd.Series],
+    uri: str,
+    code_level: str = 'order_book_id',
+    date_level: str = 'date',
+):
+    # several fields of one table go through a single update and a single add
+    table = quool.PanelTable(uri,
+        code_level=code_level, date_level=date_level)
+    columns = []
+    for name, panel in data.items():
+        if isinstance(panel, pd.DataFrame):
+            panel = panel.stack().reorder_levels([code_level, date_level])
+        columns.append(panel.rename(name))
+    data = pd.concat(columns, axis=1)
+    data.index.names = [code_level, date_level]
+    existed = [name for name in data.columns if name in table.columns]
+    if existed:
+        table.update(data[existed])
+    if len(existed) < data.shape[1]:
+        table.add(data.drop(columns=existed))
+    panel_cache.clear(uri)
+
+@tracing.traced()
+def get_last_date(
+    uri: str,
+    name: str,
+    code_level: str = 'order_book_id',
+    date_level: str = 'date',
+) -> pd.Timestamp:
+    table = quool.PanelTable(uri, 
+        code_level=code_level, date_level=date_level)
+    if name not in table.columns:
+        return None
+    # fragments are monthly, so walk back from the newest one 
+    # until the field has a value instead of reading its whole history
+    for fragment in reversed(table.fragments):
+        try:
+            start = pd.to_datetime(fragment, format=r"%Y%m")
+        except ValueError:
+            break
+        data = table.read(name, start=start, 
+            stop=start + pd.offsets.MonthEnd(0) + pd.Timedelta(days=1, microseconds=-1))
+        data = data[name].dropna()
+        if not data.empty:
+            return data.index.get_level_values(date_level).max()
+    else:
+        return None
+    data = table.read(name)[name].dropna()
+    return data.index.get_level_values(date_level).max() if not data.empty else None
 
 def zscore(df: pd.DataFrame):
     return df.sub(df.mean(axis=1), axis=0
@@ -169,6 +881,325 @@ def replace(
 def log(df: pd.DataFrame, base: int = 10):
     return np.log(df) / np.log(base)
 
+def _nanquantile(x: np.ndarray, q: float) -> np.ndarray:
+    # sorting pushes NaN to the row tail, which is much faster than np.nanquantile
+    ordered = np.sort(x, axis=1)
+    count = np.count_nonzero(~np.isnan(x), axis=1)
+    pos = q * np.maximum(count - 1, 0)
+    low = np.floor(pos).astype('int64')[:, None]
+    high = np.ceil(pos).astype('int64')[:, None]
+    frac = (pos - np.floor(pos)).astype(x.dtype)[:, None]
+    low = np.take_along_axis(ordered, low, axis=1)
+    high = np.take_along_axis(ordered, high, axis=1)
+    result = low + (high - low) * frac
+    result[count == 0] = np.nan
+    return result
+
+def _pp_zscore(x: np.ndarray):
+    mean = np.nanmean(x, axis=1, keepdims=True)
+    std = np.nanstd(x, axis=1, ddof=1, keepdims=True)
+    x -= mean
+    x /= std
+
+def _pp_minmax(x: np.ndarray):
+    low = np.nanmin(x, axis=1, keepdims=True)
+    high = np.nanmax(x, axis=1, keepdims=True)
+    x -= low
+    x /= high - low
+
+def _pp_clip(x: np.ndarray, down: np.ndarray, up: np.ndarray, drop: bool):
+    # NaN thresholds compare False, which keeps the value on clip and drops it on drop
+    if drop:
+        x[~((x <= up) & (x >= down))] = np.nan
+    else:
+        np.copyto(x, up, where=x > up)
+        np.copyto(x, down, where=x < down)
+
+def _pp_madoutlier(x: np.ndarray, dev: int, drop: bool = False):
+    median = _nanquantile(x, 0.5)
+    mad = _nanquantile(np.abs(x - median), 0.5)
+    _pp_clip(x, median - dev * mad, median + dev * mad, drop)
+
+def _pp_stdoutlier(x: np.ndarray, dev: int, drop: bool = False):
+    mean = np.nanmean(x, axis=1, keepdims=True)
+    std = np.nanstd(x, axis=1, ddof=1, keepdims=True)
+    _pp_clip(x, mean - dev * std, mean + dev * std, drop)
+
+def _pp_iqroutlier(x: np.ndarray, dev: int, drop: bool = False):
+    up = _nanquantile(x, 1 - dev / 2)
+    down = _nanquantile(x, dev / 2)
+    _pp_clip(x, down, up, drop)
+
+def _pp_replace(x: np.ndarray, old: int | float, new: int | float):
+    x[np.isnan(x) if np.isnan(old) else x == old] = new
+
+def _pp_log(x: np.ndarray, base: int = 10):
+    np.log(x, out=x)
+    x /= np.log(base)
+
+def _pp_neutralize(
+    x: np.ndarray,
+    exposures: dict[str, np.ndarray] = None,
+    industry: np.ndarray = None,
+    weights: np.ndarray = None,
+    intercept: bool = True,
+):
+    for i in range(0, len(x), regression.CHUNKSIZE):
+        rows = slice(i, i + regression.CHUNKSIZE)
+        design, _ = regression.design(_pp_rows(exposures, rows), 
+            _pp_rows(industry, rows), None, intercept, x[rows].shape)
+        x[rows] = regression.solve(x[rows], design, _pp_rows(weights, rows))[0]
+
+def _pp_align(value, df: pd.DataFrame):
+    # frame arguments follow the panel's axes, so row blocks can slice them
+    if isinstance(value, pd.DataFrame):
+        return value.reindex(index=df.index, columns=df.columns).to_numpy()
+    if isinstance(value, dict):
+        return {k: _pp_align(v, df) for k, v in value.items()}
+    return value
+
+def _pp_rows(value, rows: slice):
+    if isinstance(value, np.ndarray) and value.ndim == 2:
+        return value[rows]
+    if isinstance(value, dict):
+        return {k: _pp_rows(v, rows) for k, v in value.items()}
+    return value
+
+def _pp_repr(value) -> str:
+    if isinstance(value, pd.DataFrame):
+        return f"<DataFrame {value.shape[0]}x{value.shape[1]} at {id(value):#x}>"
+    if isinstance(value, dict):
+        return "{" + ", ".join(f"{k!r}: {_pp_repr(v)}" for k, v in value.items()) + "}"
+    return repr(value)
+
+class Preprocessor:
+
+    kernels = {
+        "zscore": _pp_zscore,
+        "minmax": _pp_minmax,
+        "madoutlier": _pp_madoutlier,
+        "stdoutlier": _pp_stdoutlier,
+        "iqroutlier": _pp_iqroutlier,
+        "replace": _pp_replace,
+        "log": _pp_log,
+        "neutralize": _pp_neutralize,
+    }
+
+    def __init__(
+        self,
+        *steps: str | tuple[str, dict],
+        inplace: bool = False,
+        dtype: str | np.dtype = 'float64',
+        chunksize: int = None,
+    ):
+        self.steps = []
+        for step in steps:
+            name, kwargs = (step, {}) if isinstance(step, str) else step
+            self.add(name, **kwargs)
+        self.inplace = inplace
+        self.dtype = np.dtype(dtype)
+        self.chunksize = chunksize
+
+    def add(self, name: str, **kwargs):
+        if name not in self.kernels:
+            raise ValueError(f"unknown preprocessing step {name}")
+        self.steps.append((name, kwargs))
+        return self
+
+    def zscore(self):
+        return self.add("zscore")
+
+    def minmax(self):
+        return self.add("minmax")
+
+    def madoutlier(self, dev: int, drop: bool = False):
+        return self.add("madoutlier", dev=dev, drop=drop)
+
+    def stdoutlier(self, dev: int, drop: bool = False):
+        return self.add("stdoutlier", dev=dev, drop=drop)
+
+    def iqroutlier(self, dev: int, drop: bool = False):
+        return self.add("iqroutlier", dev=dev, drop=drop)
+
+    def replace(self, old: int | float, new: int | float):
+        return self.add("replace", old=old, new=new)
+
+    def log(self, base: int = 10):
+        return self.add("log", base=base)
+
+    def neutralize(
+        self,
+        exposures: dict[str, pd.DataFrame] = None,
+        industry: pd.DataFrame = None,
+        weights: pd.DataFrame = None,
+        intercept: bool = True,
+    ):
+        return self.add("neutralize", exposures=exposures, 
+            industry=industry, weights=weights, intercept=intercept)
+
+    def __repr__(self) -> str:
+        return "Preprocessor(" + ", ".join(
+            f"{name}(" + ", ".join(f"{k}={_pp_repr(v)}" for k, v in kwargs.items()) + ")"
+            for name, kwargs in self.steps
+        ) + ")"
+
+    @tracing.traced('Preprocessor')
+    def __call__(self, df: pd.DataFrame) -> pd.DataFrame:
+        values = df.to_numpy(dtype=self.dtype, copy=not self.inplace)
+        if not values.flags.writeable:
+            values = values.copy()
+        # every step is cross-sectional, so row blocks can run the whole chain independently
+        chunksize = self.chunksize or max(len(values), 1)
+        steps = [(name, {k: _pp_align(v, df) for k, v in kwargs.items()}) 
+            for name, kwargs in self.steps]
+        with warnings.catch_warnings(), np.errstate(all='ignore'):
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            for i in range(0, len(values), chunksize):
+                rows = slice(i, i + chunksize)
+                block = values[rows]
+                for name, kwargs in steps:
+                    self.kernels[name](block, **_pp_rows(kwargs, rows))
+        return pd.DataFrame(values, index=df.index, columns=df.columns, copy=False)
+
+@tracing.traced()
+def save_report(
+    result: str | Path,
+    kind: str,
+    frames: dict[str, pd.DataFrame | pd.Series],
+    meta: dict = None,
+    backend: str = 'parquet',
+    image: str | Path = None,
+) -> Path:
+    result = Path(result).expanduser()
+    result.mkdir(parents=True, exist_ok=True)
+    items = {}
+    for key, frame in frames.items():
+        series = isinstance(frame, pd.Series)
+        name = frame.name if series else None
+        frame = frame.to_frame(name=key) if series else frame.copy()
+        # columnar formats want flat string labels and a plain index
+        frame.columns = [str(col) for col in frame.columns]
+        index = [f"__index_{i}__" for i in range(frame.index.nlevels)]
+        names = list(frame.index.names)
+        frame.index.names = index
+        frame = frame.reset_index()
+        # mixed evaluation tables (timedeltas next to ratios) are kept as text
+        mixed = [col for col in frame.columns if frame[col].dtype == object]
+        frame[mixed] = frame[mixed].astype(str)
+        file = f"{key}.{backend}"
+        if backend == 'feather':
+            frame.to_feather(result / file)
+        else:
+            frame.to_parquet(result / file, index=False)
+        items[key] = {"file": file, "index": index, "names": names,
+            "series": series, "name": name}
+    manifest = {
+        "kind": kind, "backend": backend, "created": pd.Timestamp.now().isoformat(),
+        "image": image and str(image), "meta": meta or {}, "items": items,
+    }
+    (result / "manifest.json").write_text(json.dumps(manifest, indent=2, default=str))
+    return result
+
+def load_report(result: str | Path) -> tuple[dict, dict]:
+    result = Path(result).expanduser()
+    manifest = json.loads((result / "manifest.json").read_text())
+    frames = {}
+    for key, item in manifest["items"].items():
+        if manifest["backend"] == 'feather':
+            frame = pd.read_feather(result / item["file"])
+        else:
+            frame = pd.read_parquet(result / item["file"])
+        frame = frame.set_index(item["index"])
+        frame.index.names = item["names"]
+        if item["series"]:
+            frame = frame.iloc[:, 0].rename(item["name"])
+        frames[key] = frame
+    return manifest, frames
+
+def _show(fig, image: str | bool):
+    fig.tight_layout()
+    if not isinstance(image, bool):
+        fig.savefig(image)
+        plt.close(fig)
+    else:
+        fig.show()
+
+@tracing.traced('plot')
+def _plot_crosssection(data: pd.DataFrame, crossdate: str, image: str | bool = True):
+    fig, axes = plt.subplots(2, 1, figsize=(20, 20))
+    data["factor"].plot.hist(bins=100, ax=axes[0])
+    data.plot.scatter(ax=axes[1], title=crossdate,
+        x="factor", y="future_returns")
+    _show(fig, image)
+
+@tracing.traced('plot')
+def _plot_inforcoef(inforcoef: pd.Series, image: str | bool = True):
+    fig, ax = plt.subplots(1, 1, figsize=(20, 10))
+    ax = inforcoef.plot.bar(ax=ax, title=inforcoef.name)
+    step = max(inforcoef.shape[0] // 10, 1)
+    ax.set_xticks([i for i in range(0, inforcoef.shape[0], step)],
+        [inforcoef.index[i].strftime(r'%Y-%m-%d') for i in range(0, inforcoef.shape[0], step)])
+    _show(fig, image)
+
+@tracing.traced('plot')
+def _plot_backtest(frames: dict, image: str | bool = True):
+    keys = ['ngroup_value', 'ngroup_turnover', 'topk_value', 'topk_turnover',
+        'longshort_value', 'ngroup_exvalue', 'topk_exvalue']
+    keys = [key for key in keys if key in frames]
+    fig, axes = plt.subplots(nrows=len(keys), ncols=1, figsize=(20, 10 * len(keys)))
+    for key, ax in zip(keys, axes):
+        frames[key].plot(ax=ax, title=frames[key].name)
+    _show(fig, image)
+
+@tracing.traced()
+def render_report(
+    result: str | Path,
+    image: str | Path = None,
+    background: bool = False,
+):
+    # figures are drawn from the saved report, so they can wait or run elsewhere
+    if background:
+        # a fresh interpreter, so the calling script is not imported again
+        return subprocess.Popen([sys.executable, str(Path(__file__).resolve()), 
+            'render', str(result)] + ([str(image)] if image else []))
+    manifest, frames = load_report(result)
+    image = image or manifest["image"] or Path(result) / f"{manifest['kind']}.png"
+    if manifest["kind"] == 'crosssection':
+        _plot_crosssection(frames["data"], manifest["meta"]["crossdate"], image)
+    elif manifest["kind"] == 'inforcoef':
+        _plot_inforcoef(frames["inforcoef"], image)
+    elif manifest["kind"] == 'backtest':
+        for key in list(frames):
+            frames[key].name = key.replace('_', ' ')
+        _plot_backtest(frames, image)
+    else:
+        raise ValueError(f"unknown report kind {manifest['kind']}")
+    return image
+
+def _report(
+    result: str | Path,
+    kind: str,
+    frames: dict,
+    meta: dict,
+    backend: str,
+    image: str | bool,
+    render: str,
+) -> bool:
+    # returns whether the figure is still to be drawn inline
+    if result is None or backend == 'excel':
+        if render != 'inline':
+            raise ValueError("deferred rendering needs a parquet or feather result")
+        return image is not None
+    save_report(result, kind, frames, meta, backend,
+        None if isinstance(image, bool) else image)
+    if image is None or render == 'deferred':
+        return False
+    if render == 'background':
+        render_report(result, None if isinstance(image, bool) else image, background=True)
+        return False
+    return True
+
+@tracing.traced()
 def perform_crosssection(
     factor: pd.DataFrame,
     price: pd.DataFrame = None,
@@ -177,6 +1208,8 @@ def perform_crosssection(
     rank: bool = False,
     image: str | bool = True,
     result: str = None,
+    backend: str = 'excel',
+    render: str = 'inline',
 ):
     crossdate = factor.index[min(crossdate, -rebalance - 1)].strftime(r"%Y-%m-%d")
     factor = factor.loc[crossdate]
@@ -189,20 +1222,80 @@ def perform_crosssection(
         factor = factor.rank()
     data = pd.concat([factor, future_returns], 
         axis=1, keys=["factor", "future_returns"])
-    if image is not None:
-        fig, axes = plt.subplots(2, 1, figsize=(20, 20))
-        data["factor"].plot.hist(bins=100, ax=axes[0])
-        data.plot.scatter(ax=axes[1], title=crossdate,
-            x="factor", y="future_returns")
-        fig.tight_layout()
-        if not isinstance(image, bool):
-            fig.savefig(image)
-        else:
-            fig.show()
-    if result is not None:
+    if _report(result, 'crosssection', {'data': data}, 
+        {'crossdate': crossdate}, backend, image, render):
+        _plot_crosssection(data, crossdate, image)
+    if result is not None and backend == 'excel':
         data.to_excel(result)
     return data
 
+def _rowcorr(
+    left: np.ndarray, 
+    right: np.ndarray, 
+    method: str = 'pearson',
+) -> np.ndarray:
+    # correlation of every row pair over the columns valid in both
+    valid = ~np.isnan(left) & ~np.isnan(right)
+    if method == 'spearman':
+        left = np.where(valid, left, np.nan)
+        right = np.where(valid, right, np.nan)
+        left = np.add(*_rank(left)) / 2
+        right = np.add(*_rank(right)) / 2
+    count = valid.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        left = np.where(valid, left, 0)
+        right = np.where(valid, right, 0)
+        left = np.where(valid, left - (left.sum(axis=1) / count)[:, None], 0)
+        right = np.where(valid, right - (right.sum(axis=1) / count)[:, None], 0)
+        corr = (left * right).sum(axis=1) / np.sqrt(
+            (left ** 2).sum(axis=1) * (right ** 2).sum(axis=1))
+    corr[count < 2] = np.nan
+    return corr
+
+@tracing.traced()
+def perform_inforcoefs(
+    factors: dict[str, pd.DataFrame],
+    price: pd.DataFrame,
+    rebalance: int | list = (1, 5, 10, 20),
+    method: str = 'pearson',
+    result: str = None,
+) -> dict[str, pd.DataFrame]:
+    rebalance = [rebalance] if isinstance(rebalance, int) else list(rebalance)
+    names = list(factors)
+    index = price.index
+    columns = price.columns
+    for name in names:
+        index = index.intersection(factors[name].index)
+        columns = columns.intersection(factors[name].columns)
+    price = price.reindex(index=index, columns=columns).to_numpy(dtype='float64')
+
+    # every horizon's forward returns are computed once, spearman ranks are taken 
+    # per factor and horizon over the codes valid in both, as perform_inforcoef does
+    panels = {name: factors[name].reindex(index=index, columns=columns).to_numpy(dtype='float64')
+        for name in names}
+    cube = np.full((len(names), len(rebalance), len(index)), np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for j, horizon in enumerate(rebalance):
+            future = np.full_like(price, np.nan)
+            future[:len(index) - horizon] = price[horizon:] / price[:len(index) - horizon] - 1
+            for i, name in enumerate(names):
+                cube[i, j] = _rowcorr(panels[name], future, method)
+
+    inforcoef = pd.DataFrame(cube.reshape(-1, len(index)).T, index=index,
+        columns=pd.MultiIndex.from_product([names, rebalance], names=['factor', 'rebalance']))
+    count = inforcoef.count()
+    mean = inforcoef.mean()
+    std = inforcoef.std()
+    summary = pd.concat([mean, std, mean / std, mean / std * np.sqrt(count), 
+        (inforcoef > 0).sum() / count, count], axis=1, 
+        keys=['ic_mean', 'ic_std', 'ic_ir', 't_stat', 'positive_ratio', 'count'])
+    if result is not None:
+        with tracing.span('excel'), pd.ExcelWriter(result) as writer:
+            summary.to_excel(writer, sheet_name='summary')
+            inforcoef.to_excel(writer, sheet_name='inforcoef')
+    return {'inforcoef': inforcoef, 'summary': summary, 'cube': cube}
+
+@tracing.traced()
 def perform_inforcoef(
     factor: pd.DataFrame,
     price: pd.DataFrame,
@@ -210,25 +1303,51 @@ def perform_inforcoef(
     method: str = 'pearson',
     image: str | bool = True,
     result: str = None,
+    backend: str = 'excel',
+    render: str = 'inline',
 ):
     future_returns = price.shift(-rebalance) / price - 1
-    inforcoef = factor.corrwith(future_returns, axis=1, method=method).dropna()
+    if method in ('pearson', 'spearman'):
+        factor, future_returns = factor.align(future_returns, join='inner')
+        inforcoef = pd.Series(_rowcorr(factor.to_numpy(dtype='float64'), 
+            future_returns.to_numpy(dtype='float64'), method), index=factor.index).dropna()
+    else:
+        inforcoef = factor.corrwith(future_returns, axis=1, method=method).dropna()
+    return report_inforcoef(inforcoef, rebalance, method, image, result, backend, render)
+
+def report_inforcoef(
+    inforcoef: pd.Series,
+    rebalance: int = 5,
+    method: str = 'pearson',
+    image: str | bool = True,
+    result: str = None,
+    backend: str = 'excel',
+    render: str = 'inline',
+) -> pd.Series:
     inforcoef.name = f"infocoef"
-    if image is not None:
-        fig, ax = plt.subplots(1, 1, figsize=(20, 10))
-        ax = inforcoef.plot.bar(ax=ax, title=inforcoef.name)
-        ax.set_xticks([i for i in range(0, inforcoef.shape[0], inforcoef.shape[0] // 10)], 
-            [inforcoef.index[i].strftime(r'%Y-%m-%d') for i in range(0, inforcoef.shape[0], inforcoef.shape[0] // 10)])
-        fig.tight_layout()
-        if not isinstance(image, bool):
-            fig.savefig(image)
-        else:
-            fig.show()
-    if result is not None:
+    if _report(result, 'inforcoef', {'inforcoef': inforcoef}, 
+        {'rebalance': rebalance, 'method': method}, backend, image, render):
+        _plot_inforcoef(inforcoef, image)
+    if result is not None and backend == 'excel':
         inforcoef.to_excel(result)
     return inforcoef
 
-def perform_backtest(
+def _group_strategy(
+    groups: SharedPanel,
+    group: int,
+    price: SharedPanel,
+    delay: int = 1,
+    commission: float = 0.002,
+    benchmark: pd.Series = None,
+) -> dict:
+    # the blocks belong to the caller, with n_jobs=1 every group gets the very 
+    # same objects, a worker's attached copy is released when it is collected
+    group_frame, price_frame = groups.frame(), price.frame()
+    return quool.weight_strategy(group_frame.where(group_frame == group), 
+        price_frame, delay, 'both', commission, benchmark)
+
+@tracing.traced()
+def _backtest_quool(
     factor: pd.DataFrame,
     price: pd.DataFrame,
     longshort: int = 1,
@@ -238,15 +1357,14 @@ def perform_backtest(
     ngroup: int = 5,
     commission: float = 0.002,
     n_jobs: int = -1,
-    image: str | bool = True,
-    result: str = None,
-):
+) -> dict:
     # ngroup test
     groups = factor.apply(lambda x: pd.qcut(x, q=ngroup, labels=False), axis=1) + 1
-    ngroup_result = Parallel(n_jobs=n_jobs, backend='loky')(
-        delayed(quool.weight_strategy)(
-            groups.where(groups == i), price, delay, 'both', commission, benchmark
-    ) for i in range(1, ngroup + 1))
+    with SharedPanel(groups) as shared_groups, SharedPanel(price) as shared_price:
+        ngroup_result = Parallel(n_jobs=n_jobs, backend='loky')(
+            delayed(_group_strategy)(
+                shared_groups, i, shared_price, delay, commission, benchmark
+        ) for i in range(1, ngroup + 1))
     ngroup_evaluation = pd.concat([res['evaluation'] for res in ngroup_result], 
         axis=1, keys=range(1, ngroup + 1)).add_prefix('group')
     ngroup_returns = pd.concat([res['returns'] for res in ngroup_result], 
@@ -255,12 +1373,249 @@ def perform_backtest(
         axis=1, keys=range(1, ngroup + 1)).add_prefix('group')
 
     # topk test
-    topks = (factor.rank(axis=1) * longshort) <= topk
+    topks = factor.rank(axis=1, ascending=longshort > 0) <= topk
     topks = factor.mask(topks, 1).mask(~topks, 0)
     topk_result = quool.weight_strategy(topks, price, delay, 'both', commission, benchmark)
-    topk_evaluation = topk_result['evaluation']
-    topk_returns = topk_result['returns']
-    topk_turnover = topk_result['turnover']
+    return {
+        'ngroup_evaluation': ngroup_evaluation,
+        'ngroup_returns': ngroup_returns,
+        'ngroup_turnover': ngroup_turnover,
+        'topk_evaluation': topk_result['evaluation'],
+        'topk_returns': topk_result['returns'],
+        'topk_turnover': topk_result['turnover'],
+    }
+
+def _rank(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # lowest and highest 1-based rank of every value's tie run along each row, 
+    # the average rank pandas uses by default is their mean
+    nrow, ncol = values.shape
+    order = np.argsort(values, axis=1, kind='stable')
+    ordered = np.take_along_axis(values, order, axis=1)
+    position = np.broadcast_to(np.arange(ncol), (nrow, ncol))
+    start = np.ones((nrow, ncol), dtype=bool)
+    start[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    end = np.ones((nrow, ncol), dtype=bool)
+    end[:, :-1] = start[:, 1:]
+    first = np.maximum.accumulate(np.where(start, position, 0), axis=1)
+    last = np.minimum.accumulate(np.where(end, position, ncol - 1)[:, ::-1], axis=1)[:, ::-1]
+    low = np.empty((nrow, ncol))
+    high = np.empty((nrow, ncol))
+    np.put_along_axis(low, order, first + 1., axis=1)
+    np.put_along_axis(high, order, last + 1., axis=1)
+    missing = np.isnan(values)
+    low[missing] = np.nan
+    high[missing] = np.nan
+    return low, high
+
+def _qcut_labels(rank: np.ndarray, ngroup: int) -> np.ndarray:
+    # pd.qcut without the per-date loop: among n valid values the one 
+    # with min-rank r falls into bucket ceil((r - 1) * ngroup / (n - 1))
+    valid = ~np.isnan(rank)
+    count = valid.sum(axis=1, keepdims=True)
+    position = np.where(valid, rank - 1, 0).astype('int64')
+    labels = np.maximum(-(-(position * ngroup) // np.maximum(count - 1, 1)), 1)
+    return np.where(valid, labels, 0).astype('int16')
+
+def _topk_labels(
+    low: np.ndarray, 
+    high: np.ndarray, 
+    longshort: int, 
+    topk: int, 
+    label: int,
+) -> np.ndarray:
+    # longshort < 0 takes the highest values, ranked descending like -factor
+    rank = (low + high) / 2
+    if longshort < 0:
+        rank = (~np.isnan(rank)).sum(axis=1, keepdims=True) + 1 - rank
+    return np.where(rank <= topk, label, 0).astype('int16')
+
+def _simulate_labels(
+    labels: np.ndarray,
+    nlabel: int,
+    returns: np.ndarray,
+    delay: int = 1,
+    commission: float = 0.002,
+    chunksize: int = 256,
+) -> tuple[np.ndarray, np.ndarray]:
+    # labels is a (layer, date, code) stack; each non-zero label is an equal 
+    # weighted portfolio rebalanced daily, label 0 is held by no portfolio
+    nlayer, ndate, ncode = labels.shape
+    width = nlabel + 1
+    counts = np.zeros((ndate, width))
+    for i in range(0, ndate, chunksize):
+        block = labels[:, i:i + chunksize]
+        flat = (np.arange(block.shape[1])[None, :, None] * width + block).ravel()
+        counts[i:i + chunksize] = np.bincount(flat, minlength=block.shape[1] * width
+            ).reshape(block.shape[1], width)
+    inverse = np.divide(1, counts, out=np.zeros_like(counts), where=counts > 0)
+    inverse[:, 0] = 0
+
+    # weights formed on date t earn the return of date t + delay + 1
+    future = np.zeros_like(returns)
+    if ndate > delay + 1:
+        future[:ndate - delay - 1] = returns[delay + 1:]
+
+    gross = np.zeros((ndate, width))
+    trade = np.zeros((ndate, width))
+    for i in range(0, ndate, chunksize):
+        j = min(i + chunksize, ndate)
+        block = labels[:, i:j]
+        rows = np.arange(j - i)[None, :, None]
+        flat = (rows * width + block).ravel()
+        weight = inverse[i:j][rows, block]
+        gross[i:j] = np.bincount(flat, weights=np.broadcast_to(future[i:j], block.shape).ravel(), 
+            minlength=(j - i) * width).reshape(j - i, width)
+        if i > 0:
+            prev = labels[:, i - 1:j - 1]
+            prev_weight = inverse[i - 1:j - 1][rows, prev]
+        else:
+            prev = np.zeros_like(block)
+            prev[:, 1:] = block[:, :-1]
+            prev_weight = np.zeros_like(weight)
+            prev_weight[:, 1:] = weight[:, :-1]
+        same = block == prev
+        trade[i:j] = np.bincount(flat, weights=np.where(same, 
+            np.abs(weight - prev_weight), weight).ravel(), minlength=(j - i) * width
+        ).reshape(j - i, width)
+        trade[i:j] += np.bincount((rows * width + prev).ravel(), weights=np.where(
+            same, 0, prev_weight).ravel(), minlength=(j - i) * width).reshape(j - i, width)
+    gross *= inverse
+
+    # book everything on the date it is realized
+    booked = np.zeros_like(gross)
+    booked[delay + 1:] = gross[:max(ndate - delay - 1, 0)]
+    turnover = np.zeros_like(trade)
+    turnover[delay:] = trade[:max(ndate - delay, 0)] / 2
+    return (booked - commission * turnover)[:, 1:], turnover[:, 1:]
+
+def _evaluate(
+    returns: pd.Series, 
+    turnover: pd.Series = None,    
+    benchmark: pd.Series = None,
+) -> pd.Series:
+    value = (returns + 1).cumprod()
+    if benchmark is not None:
+        benchmark = benchmark.squeeze()
+        benchmark_returns = benchmark.pct_change(fill_method=None).fillna(0)
+    
+    evaluation = pd.Series(name='evaluation', dtype=object)
+    evaluation['total_return(%)'] = (value.iloc[-1] - 1) * 100
+    evaluation['annual_return(%)'] = (value.iloc[-1] ** (252 / value.shape[0]) - 1) * 100
+    evaluation['annual_volatility(%)'] = (returns.std() * np.sqrt(252)) * 100
+    down_volatility = (returns[returns < 0].std() * np.sqrt(252)) * 100
+    cumdrawdown = -(value / value.cummax() - 1)
+    maxdate = cumdrawdown.idxmax()
+    startdate = cumdrawdown.loc[:maxdate][cumdrawdown.loc[:maxdate] == 0].index[-1]
+    evaluation['max_drawdown(%)'] = (cumdrawdown.max()) * 100
+    evaluation['max_drawdown_period(days)'] = maxdate - startdate
+    evaluation['max_drawdown_start'] = startdate
+    evaluation['max_drawdown_stop'] = maxdate
+    evaluation['daily_turnover(%)'] = turnover.mean() * 100 if turnover is not None else np.nan
+    evaluation['sharpe_ratio'] = evaluation['annual_return(%)'] / evaluation['annual_volatility(%)']
+    evaluation['sortino_ratio'] = evaluation['annual_return(%)'] / down_volatility
+    evaluation['calmar_ratio'] = evaluation['annual_return(%)'] / evaluation['max_drawdown(%)']
+    if benchmark is not None:
+        exreturns = returns - benchmark_returns
+        benchmark_volatility = (benchmark_returns.std() * np.sqrt(252)) * 100
+        exvalue = (1 + exreturns).cumprod()
+        evaluation['total_exreturn(%)'] = (exvalue.iloc[-1] - 1) * 100
+        evaluation['annual_exreturn(%)'] = (exvalue.iloc[-1] ** (252 / exvalue.shape[0]) - 1) * 100
+        evaluation['annual_exvolatility(%)'] = (exreturns.std() * np.sqrt(252)) * 100
+        evaluation['beta'] = returns.cov(benchmark_returns) / benchmark_returns.var()
+        evaluation['alpha(%)'] = (returns.mean() - (evaluation['beta'] * (benchmark_returns.mean()))) * 100
+        evaluation['treynor_ratio'] = (evaluation['annual_exreturn(%)'] / evaluation['beta'])
+        evaluation['information_ratio'] = evaluation['annual_exreturn(%)'] / benchmark_volatility
+    return evaluation
+
+@tracing.traced()
+def _backtest_native(
+    factor: pd.DataFrame,
+    price: pd.DataFrame,
+    longshort: int = 1,
+    topk: int = 100,
+    benchmark: pd.Series = None,
+    delay: int = 1,
+    ngroup: int = 5,
+    commission: float = 0.002,
+) -> dict:
+    returns = price.pct_change(fill_method=None).reindex(
+        index=factor.index, columns=factor.columns).fillna(0).to_numpy()
+    low, high = _rank(factor.to_numpy(dtype='float64'))
+    # topk portfolio rides along as label ngroup + 1 in a second layer
+    labels = np.stack([_qcut_labels(low, ngroup), 
+        _topk_labels(low, high, longshort, topk, ngroup + 1)])
+    del low, high
+    portfolio_returns, portfolio_turnover = _simulate_labels(
+        labels, ngroup + 1, returns, delay, commission)
+    return _portfolios(portfolio_returns, portfolio_turnover, factor.index, ngroup, benchmark)
+
+def _portfolios(
+    portfolio_returns: np.ndarray,
+    portfolio_turnover: np.ndarray,
+    index: pd.Index,
+    ngroup: int,
+    benchmark: pd.Series = None,
+) -> dict:
+    # the ngroup groups and the topk portfolio as the last column
+    columns = [f'group{i}' for i in range(1, ngroup + 1)]
+    ngroup_returns = pd.DataFrame(portfolio_returns[:, :ngroup], index=index, columns=columns)
+    ngroup_turnover = pd.DataFrame(portfolio_turnover[:, :ngroup], index=index, columns=columns)
+    ngroup_evaluation = pd.concat([_evaluate(ngroup_returns[col], ngroup_turnover[col], benchmark)
+        for col in columns], axis=1, keys=columns)
+    topk_returns = pd.Series(portfolio_returns[:, ngroup], index=index, name='return')
+    topk_turnover = pd.Series(portfolio_turnover[:, ngroup], index=index, name='turnover')
+    return {
+        'ngroup_evaluation': ngroup_evaluation,
+        'ngroup_returns': ngroup_returns,
+        'ngroup_turnover': ngroup_turnover,
+        'topk_evaluation': _evaluate(topk_returns, topk_turnover, benchmark),
+        'topk_returns': topk_returns,
+        'topk_turnover': topk_turnover,
+    }
+
+@tracing.traced()
+def perform_backtest(
+    factor: pd.DataFrame,
+    price: pd.DataFrame,
+    longshort: int = 1,
+    topk: int = 100,
+    benchmark: pd.Series = None,
+    delay: int = 1,
+    ngroup: int = 5,
+    commission: float = 0.002,
+    n_jobs: int = -1,
+    image: str | bool = True,
+    result: str = None,
+    engine: str = 'native',
+    backend: str = 'excel',
+    render: str = 'inline',
+):
+    if engine == 'quool':
+        portfolios = _backtest_quool(factor, price, longshort, topk, 
+            benchmark, delay, ngroup, commission, n_jobs)
+    else:
+        portfolios = _backtest_native(factor, price, longshort, topk, 
+            benchmark, delay, ngroup, commission)
+    return report_backtest(portfolios, longshort, topk, benchmark, delay, 
+        ngroup, commission, image, result, backend, render)
+
+def report_backtest(
+    portfolios: dict,
+    longshort: int = 1,
+    topk: int = 100,
+    benchmark: pd.Series = None,
+    delay: int = 1,
+    ngroup: int = 5,
+    commission: float = 0.002,
+    image: str | bool = True,
+    result: str = None,
+    backend: str = 'excel',
+    render: str = 'inline',
+) -> dict:
+    ngroup_evaluation, ngroup_returns, ngroup_turnover = \
+        portfolios['ngroup_evaluation'], portfolios['ngroup_returns'], portfolios['ngroup_turnover']
+    topk_evaluation, topk_returns, topk_turnover = \
+        portfolios['topk_evaluation'], portfolios['topk_returns'], portfolios['topk_turnover']
 
     # longshort test
     longshort_returns = longshort * (ngroup_returns[f"group{ngroup}"] - ngroup_returns["group1"])
@@ -288,6 +1643,7 @@ def perform_backtest(
     
     # naming
     ngroup_evaluation.name = "ngroup evaluation"
+    topk_evaluation.name = "topk evaluation"
     ngroup_value.name = "ngroup value"
     topk_value.name = "topk value"
     longshort_value.name = "longshort value"
@@ -297,36 +1653,32 @@ def perform_backtest(
         ngroup_exvalue.name = "ngroup exvalue"
         topk_exvalue.name = "topk exvalue"
 
-    if image is not None:
-        fignum = 5 + 2 * (benchmark is not None)
-        fig, axes = plt.subplots(nrows=fignum, ncols=1, figsize=(20, 10 * fignum))
-        ngroup_value.plot(ax=axes[0], title=ngroup_value.name)
-        ngroup_turnover.plot(ax=axes[1], title=ngroup_turnover.name)
-        topk_value.plot(ax=axes[2], title=topk_value.name)
-        topk_turnover.plot(ax=axes[3], title=topk_turnover.name)
-        longshort_value.plot(ax=axes[4], title=longshort_value.name)
-        if benchmark is not None:
-            ngroup_exvalue.plot(ax=axes[5], title=ngroup_exvalue.name)
-            topk_exvalue.plot(ax=axes[6], title=topk_exvalue.name)
-        fig.tight_layout()
-        if not isinstance(image, bool):
-            fig.savefig(image)
-        else:
-            fig.show()
+    frames = {
+        'ngroup_evaluation': ngroup_evaluation, 'topk_evaluation': topk_evaluation,
+        'ngroup_returns': ngroup_returns, 'ngroup_value': ngroup_value, 
+        'ngroup_turnover': ngroup_turnover, 'topk_returns': topk_returns, 
+        'topk_value': topk_value, 'topk_turnover': topk_turnover, 
+        'longshort_returns': longshort_returns, 'longshort_value': longshort_value,
+    }
+    if benchmark is not None:
+        frames.update({'ngroup_exvalue': ngroup_exvalue, 'topk_exvalue': topk_exvalue})
+    if _report(result, 'backtest', frames, {'longshort': longshort, 'ngroup': ngroup, 
+        'topk': topk, 'delay': delay, 'commission': commission}, backend, image, render):
+        _plot_backtest(frames, image)
 
-    if result is not None:
-        with pd.ExcelWriter(result) as writer:
+    if result is not None and backend == 'excel':
+        with tracing.span('excel'), pd.ExcelWriter(result) as writer:
             ngroup_evaluation.to_excel(writer, sheet_name=ngroup_evaluation.name)
             topk_evaluation.to_excel(writer, sheet_name=topk_evaluation.name)
-            ngroup_value.to_excel(writer, sheet_name=ngroup_returns.name)
+            ngroup_value.to_excel(writer, sheet_name=ngroup_value.name)
             ngroup_turnover.to_excel(writer, sheet_name=ngroup_turnover.name)
-            topk_value.to_excel(writer, sheet_name=topk_returns.name)
+            topk_value.to_excel(writer, sheet_name=topk_value.name)
             topk_turnover.to_excel(writer, sheet_name=topk_turnover.name)
-            longshort_value.to_excel(writer, sheet_name=longshort_returns.name)
+            longshort_value.to_excel(writer, sheet_name=longshort_value.name)
             
             if benchmark is not None:
-                ngroup_exvalue.to_excel(writer, sheet_name=ngroup_exreturns.name)
-                topk_exvalue.to_excel(writer, sheet_name=topk_exreturns.name)
+                ngroup_exvalue.to_excel(writer, sheet_name=ngroup_exvalue.name)
+                topk_exvalue.to_excel(writer, sheet_name=topk_exvalue.name)
 
     return {
         'ngroup_evaluation': ngroup_evaluation, 
@@ -340,3 +1692,9 @@ def perform_backtest(
         'longshort_returns': longshort_returns, 
         'longshort_value': longshort_value,
     }
+
+
+if __name__ == "__main__":
+    # python factor.py render <result> [<image>]
+    if len(sys.argv) > 2 and sys.argv[1] == 'render':
+        render_report(*sys.argv[2:4])
@@ -1,41 +1,41 @@
 import factor as ft
+import tracing
+import fundamental
 import pandas as pd
 
+@tracing.traced()
 def get_roa(
     start: str, stop: str,
 ) -> pd.DataFrame:
     qtd_uri = '/home/data/quotes-day'
-    fin_uri = '/home/data/financial'
-    rollback = ft.get_trading_days_rollback(qtd_uri, start, 250)
-    trading_days = ft.get_trading_days(qtd_uri, rollback, stop)
-    net_profit = ft.get_data(fin_uri, 'net_profit', start=rollback, stop=stop)
-    net_profit = net_profit.reindex(trading_days).ffill()
-    total_asset = ft.get_data(fin_uri, 'total_assets', start=rollback, stop=stop)
-    total_asset = total_asset.reindex(trading_days).ffill()
-    return (net_profit / total_asset).loc[start:stop]
+    trading_days = ft.get_trading_days(qtd_uri, start, stop)
+    panels = fundamental.load_daily('net_profit, total_assets', start, stop)
+    return (panels['net_profit'] / panels['total_assets']).reindex(trading_days).frame('float64')
 
+@tracing.traced()
 def get_roe(
     start: str, stop: str,
 ) -> pd.DataFrame:
     qtd_uri = '/home/data/quotes-day'
-    fin_uri = '/home/data/financial'
-    rollback = ft.get_trading_days_rollback(qtd_uri, start, 250)
-    trading_days = ft.get_trading_days(qtd_uri, rollback, stop)
-    net_profit = ft.get_data(fin_uri, 'net_profit', start=rollback, stop=stop)
-    net_profit = net_profit.reindex(trading_days).ffill()
-    total_equity = ft.get_data(fin_uri, 'total_equity', start=rollback, stop=stop)
-    total_equity = total_equity.reindex(trading_days).ffill()
-    return (net_profit / total_equity).loc[start:stop]
+    trading_days = ft.get_trading_days(qtd_uri, start, stop)
+    panels = fundamental.load_daily('net_profit, total_equity', start, stop)
+    return (panels['net_profit'] / panels['total_equity']).reindex(trading_days).frame('float64')
 
+@tracing.traced()
 def get_current_asset_ratio(
     start: str, stop: str,
 ) -> pd.DataFrame:
     qtd_uri = '/home/data/quotes-day'
-    fin_uri = '/home/data/financial'
-    rollback = ft.get_trading_days_rollback(qtd_uri, start, 250)
-    trading_days = ft.get_trading_days(qtd_uri, rollback, stop)
-    current_assets = ft.get_data(fin_uri, 'current_assets', start=rollback, stop=stop)
-    current_assets = current_assets.reindex(trading_days).ffill()
-    total_asset = ft.get_data(fin_uri, 'total_assets', start=rollback, stop=stop)
-    total_asset = total_asset.reindex(trading_days).ffill()
-    return (current_assets / total_asset).loc[start:stop]
+    trading_days = ft.get_trading_days(qtd_uri, start, stop)
+    panels = fundamental.load_daily('current_assets, total_assets', start, stop)
+    return (panels['current_assets'] / panels['total_assets']).reindex(trading_days).frame('float64')
+
+def register(graph):
+    for field in ["net_profit", "total_assets", "total_equity", "current_assets"]:
+        fundamental.register(graph, field)
+    graph.add("roa", lambda net_profit, total_asset: net_profit / total_asset, 
+        ["net_profit_daily", "total_assets_daily"])
+    graph.add("roe", lambda net_profit, total_equity: net_profit / total_equity, 
+        ["net_profit_daily", "total_equity_daily"])
+    graph.add("current_asset_ratio", lambda current_assets, total_asset: current_assets / total_asset, 
+        ["current_assets_daily", "total_assets_daily"])
@@ -0,0 +1,139 @@
+import json
+import quool
+import threading
+import tracing
+import numpy as np
+import pandas as pd
+import factor as ft
+from pathlib import Path
+
+
+FIN_URI = '/home/data/financial'
+QTD_URI = '/home/data/quotes-day'
+PIT_URI = '/home/data/financial-daily'
+FIELDS = ["net_profit", "total_assets", "total_equity", "current_assets"]
+_update_lock = threading.Lock()
+
+
+def asof_expand(
+    reports: pd.DataFrame,
+    days: pd.DatetimeIndex,
+    window: int = 250,
+) -> pd.DataFrame:
+    # every trading day takes the latest value reported on or before it,
+    # a value is dropped once it is window trading days old
+    reports = reports.sort_index()
+    values = reports.to_numpy(dtype='float64')
+    rows = np.where(~np.isnan(values), np.arange(len(values))[:, None], -1)
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    known = days.searchsorted(reports.index, side='left')
+    latest = reports.index.searchsorted(days, side='right') - 1
+    source = np.where(latest[:, None] >= 0, rows[np.maximum(latest, 0)], -1)
+    columns = np.arange(values.shape[1])
+    daily = np.where(source >= 0, values[np.maximum(source, 0), columns], np.nan)
+    if window is not None:
+        age = np.arange(len(days))[:, None] - known[np.maximum(source, 0)]
+        daily[(source < 0) | (age >= window)] = np.nan
+    return pd.DataFrame(daily, index=days, columns=reports.columns)
+
+def _state_path(uri: str) -> Path:
+    # dot files are skipped by the parquet reader of the table
+    return Path(uri).expanduser() / '.pit-state.json'
+
+def load_state(uri: str) -> dict:
+    path = _state_path(uri)
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+def save_state(uri: str, state: dict):
+    path = _state_path(uri)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(state, indent=2))
+    tmp.replace(path)
+
+@tracing.traced()
+def update(
+    fields: str | list = FIELDS,
+    stop: str | pd.Timestamp = None,
+    fin_uri: str = FIN_URI,
+    pit_uri: str = PIT_URI,
+    calendar_uri: str = QTD_URI,
+    window: int = 250,
+    rebuild: bool = False,
+) -> dict:
+    fields = quool.parse_commastr(fields)
+    days = ft.get_calendar(calendar_uri).range(stop=stop)
+    with _update_lock:
+        # quool only opens existing table directories
+        Path(pit_uri).expanduser().mkdir(parents=True, exist_ok=True)
+        state = {} if rebuild else load_state(pit_uri)
+        written = _update(fields, days, state, fin_uri, pit_uri, window)
+        if written:
+            save_state(pit_uri, state)
+    return written
+
+def _update(
+    fields: list,
+    days: pd.DatetimeIndex,
+    state: dict,
+    fin_uri: str,
+    pit_uri: str,
+    window: int,
+) -> dict:
+    written = {}
+    for field in fields:
+        latest = ft.get_last_date(fin_uri, field)
+        if latest is None or not len(days):
+            continue
+        record = state.get(field)
+        if record is None or record.get("window") != window:
+            begin = 0
+        else:
+            # extend past the last expanded day, and redo the days new reports reach
+            begin = days.searchsorted(pd.Timestamp(record["expanded"]), 'right')
+            if latest > pd.Timestamp(record["reports"]):
+                begin = min(begin, days.searchsorted(pd.Timestamp(record["reports"]), 'right'))
+        if begin >= len(days):
+            continue
+
+        # reports older than this are out of the window on every day to write
+        first = max(begin - window, 0) if window is not None else 0
+        reports = ft.get_data(fin_uri, field, start=days[first] if first else None,
+            stop=days[-1], cache=False)
+        daily = asof_expand(reports, days[first:], window).loc[days[begin]:]
+        ft.save_data(daily, field, pit_uri)
+        written[field] = (days[begin], days[-1])
+        state[field] = {"expanded": days[-1].strftime(r'%Y-%m-%d'),
+            "reports": latest.strftime(r'%Y-%m-%d'), "window": window}
+    return written
+
+@tracing.traced()
+def load_daily(
+    fields: str | list,
+    start: str | pd.Timestamp = None,
+    stop: str | pd.Timestamp = None,
+    pit_uri: str = PIT_URI,
+    refresh: bool = False,
+    dtype: str | np.dtype = 'float32',
+) -> dict:
+    fields = quool.parse_commastr(fields)
+    # the dump jobs bring the store up to date once, readers in their workers only read it
+    if refresh:
+        update(fields, stop, pit_uri=pit_uri)
+    return ft.load_panels(pit_uri, fields, start=start, stop=stop, dtype=dtype)
+
+def get_daily(
+    field: str,
+    start: str | pd.Timestamp = None,
+    stop: str | pd.Timestamp = None,
+    pit_uri: str = PIT_URI,
+    refresh: bool = False,
+) -> pd.DataFrame:
+    return load_daily(field, start, stop, pit_uri, refresh, 'float64')[field].frame()
+
+def register(graph, field: str):
+    # the daily panel is a ready-made field, no warmup is needed to expand it
+    return graph.add(f"{field}_daily", lambda start, stop: get_daily(field, start, stop),
+        kind=f'field:{PIT_URI}:{field}')
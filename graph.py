@@ -0,0 +1,174 @@
+import pandas as pd
+import tracing
+import factor as ft
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class Node:
+
+    def __init__(
+        self,
+        name: str,
+        func: callable,
+        inputs: list = (),
+        warmup: int = 0,
+        kind: str = 'node',
+    ):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.warmup = warmup
+        self.kind = kind
+
+    def __repr__(self) -> str:
+        return f"Node({self.name}, inputs={self.inputs}, warmup={self.warmup})"
+
+
+class FactorGraph:
+
+    def __init__(self, calendar_uri: str = '/home/data/quotes-day'):
+        self.calendar_uri = calendar_uri
+        self.nodes = {}
+
+    def add(
+        self,
+        name: str,
+        func: callable,
+        inputs: str | list = (),
+        warmup: int = 0,
+        kind: str = 'node',
+    ) -> Node:
+        inputs = [inputs] if isinstance(inputs, str) else list(inputs)
+        missing = [i for i in inputs if i not in self.nodes]
+        if missing:
+            raise KeyError(f"{name} depends on unregistered nodes {missing}")
+        if name in self.nodes:
+            node = self.nodes[name]
+            if node.kind != kind or node.inputs != inputs or node.warmup != warmup:
+                raise ValueError(f"{name} is already registered differently")
+            return node
+        node = self.nodes[name] = Node(name, func, inputs, warmup, kind)
+        return node
+
+    def field(
+        self,
+        name: str,
+        uri: str,
+        field: str = None,
+        **kwargs,
+    ) -> Node:
+        # raw fields are loaded for the range their consumers need
+        field = field or name
+        return self.add(name, lambda start, stop: ft.get_data(
+            uri, field, start=start, stop=stop, **kwargs), kind=f'field:{uri}:{field}')
+
+    def daily(self, name: str, input: str, warmup: int = 250) -> Node:
+        # report dated values carried onto trading days
+        return self.add(name, lambda data, start, stop: data.reindex(
+            ft.get_trading_days(self.calendar_uri, start, stop)).ffill(),
+            [input], warmup, kind='daily')
+
+    def node(self, name: str = None, inputs: str | list = (), warmup: int = 0):
+        def decorator(func):
+            self.add(name or func.__name__, func, inputs, warmup)
+            return func
+        return decorator
+
+    def ancestors(self, name: str) -> set:
+        seen, stack = set(), [name]
+        while stack:
+            node = stack.pop()
+            if node not in seen:
+                seen.add(node)
+                stack.extend(self.nodes[node].inputs)
+        return seen
+
+    def groups(self, targets: str | list) -> list[list]:
+        # targets sharing any ancestor go together, one run then computes it once
+        targets = [targets] if isinstance(targets, str) else list(targets)
+        groups = []
+        for target in targets:
+            nodes, members = self.ancestors(target), [target]
+            for group in [group for group in groups if group[0] & nodes]:
+                groups.remove(group)
+                nodes, members = group[0] | nodes, group[1] + members
+            groups.append((nodes, members))
+        return [members for _, members in groups]
+
+    def _plan(self, targets: list, start: pd.Timestamp) -> tuple[list, dict]:
+        order, seen = [], set()
+
+        def visit(name):
+            if name in seen:
+                return
+            seen.add(name)
+            for i in self.nodes[name].inputs:
+                visit(i)
+            order.append(name)
+
+        for target in targets:
+            visit(target)
+
+        # walk consumers before inputs so every node knows the earliest date asked of it
+        calendar = ft.get_calendar(self.calendar_uri)
+        begin = {target: start for target in targets}
+        for name in reversed(order):
+            node = self.nodes[name]
+            need = calendar.rollback(begin[name], node.warmup) if node.warmup else begin[name]
+            for i in node.inputs:
+                begin[i] = min(begin.get(i, need), need)
+        return order, begin
+
+    def _compute(self, name: str, inputs: list, start: pd.Timestamp, stop: pd.Timestamp):
+        with tracing.span(f'node:{name}') as span:
+            data = self._evaluate(name, inputs, start, stop)
+            if span is not None:
+                span["attrs"].update(tracing.sizeof(data))
+        return data
+
+    def _evaluate(self, name: str, inputs: list, start: pd.Timestamp, stop: pd.Timestamp):
+        node = self.nodes[name]
+        if node.kind.startswith('field'):
+            return node.func(start, stop)
+        if node.kind == 'daily':
+            calendar = ft.get_calendar(self.calendar_uri)
+            data = node.func(*inputs, calendar.rollback(start, node.warmup), stop)
+        else:
+            data = node.func(*inputs)
+        return data.loc[start:stop]
+
+    def run(
+        self,
+        targets: str | list,
+        start: str,
+        stop: str,
+        n_jobs: int = 4,
+    ) -> dict[str, pd.DataFrame]:
+        targets = [targets] if isinstance(targets, str) else list(targets)
+        start, stop = pd.to_datetime(start), pd.to_datetime(stop)
+        order, begin = self._plan(targets, start)
+        waiting = {name: set(self.nodes[name].inputs) for name in order}
+        consumers = {name: 0 for name in order}
+        for name in order:
+            for i in self.nodes[name].inputs:
+                consumers[i] += 1
+
+        results, running = {}, {}
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            while waiting or running:
+                for name in [n for n, deps in waiting.items() if not deps]:
+                    del waiting[name]
+                    inputs = [results[i] for i in self.nodes[name].inputs]
+                    running[executor.submit(self._compute, name, inputs, begin[name], stop)] = name
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    results[name] = future.result()
+                    for deps in waiting.values():
+                        deps.discard(name)
+                    # free intermediates once their last consumer has finished
+                    for i in self.nodes[name].inputs:
+                        consumers[i] -= 1
+                        if not consumers[i] and i not in targets:
+                            results.pop(i, None)
+        return {target: results[target].loc[start:stop] for target in targets}
@@ -1,21 +1,163 @@
+import quool
+import numpy as np
 import pandas as pd
 import factor as ft
-from tqdm import tqdm
-from joblib import Parallel, delayed
+import tracing
+from concurrent.futures import ThreadPoolExecutor
 
 
+QTM_URI = '/home/data/quotes-min'
+QTD_URI = '/home/data/quotes-day'
+
+
+class IntradayBlock:
+
+    def __init__(
+        self,
+        data: pd.DataFrame,
+        code_level: str | int = 0,
+        date_level: str | int = 1,
+    ):
+        data = data.sort_index()
+        stamps = data.index.get_level_values(date_level)
+        days = stamps.normalize()
+        self.data = data
+        self.time = (stamps - days).to_numpy()
+        codes = data.index.get_level_values(code_level)
+        keys = pd.MultiIndex.from_arrays([codes, days])
+        self.group, self.keys = keys.factorize()
+        self.keys.names = [codes.name, stamps.name]
+        # rows are sorted by code then minute, so a new group starts a new day of a code
+        self.first = np.ones(len(self.group), dtype=bool)
+        self.first[1:] = self.group[1:] != self.group[:-1]
+
+    def __getitem__(self, field: str) -> np.ndarray:
+        return self.data[field].to_numpy(dtype='float64')
+
+    def window(self, start: str, stop: str) -> np.ndarray:
+        return (self.time >= _parse_time(start)) & (self.time <= _parse_time(stop))
+
+    def sum(self, values: np.ndarray, mask: np.ndarray = None) -> pd.Series:
+        valid = ~np.isnan(values) if mask is None else mask & ~np.isnan(values)
+        sums = np.bincount(self.group, weights=np.where(valid, values, 0), minlength=len(self.keys))
+        counts = np.bincount(self.group, weights=valid, minlength=len(self.keys))
+        return pd.Series(np.where(counts > 0, sums, np.nan), index=self.keys)
+
+    def std(self, values: np.ndarray, mask: np.ndarray = None, ddof: int = 1) -> pd.Series:
+        valid = ~np.isnan(values) if mask is None else mask & ~np.isnan(values)
+        values = np.where(valid, values, 0)
+        counts = np.bincount(self.group, weights=valid, minlength=len(self.keys))
+        sums = np.bincount(self.group, weights=values, minlength=len(self.keys))
+        squares = np.bincount(self.group, weights=values ** 2, minlength=len(self.keys))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = (squares - sums ** 2 / counts) / (counts - ddof)
+        return pd.Series(np.sqrt(np.where(counts > ddof, np.maximum(var, 0), np.nan)), index=self.keys)
+
+    def diff(self, values: np.ndarray) -> np.ndarray:
+        result = np.empty_like(values)
+        result[1:] = values[1:] - values[:-1]
+        result[self.first] = np.nan
+        return result
+
+
+def _parse_time(time: str) -> np.timedelta64:
+    time = time if time.count(':') == 2 else time + ':00'
+    return pd.to_timedelta(time).to_timedelta64()
+
+
+class Aggregation:
+
+    def __init__(self, fields: str | list, func: callable):
+        self.fields = quool.parse_commastr(fields)
+        self.func = func
+
+    def __call__(self, block: IntradayBlock) -> pd.Series:
+        return self.func(block)
+
+
+def window_sum(field: str, start: str, stop: str) -> Aggregation:
+    return Aggregation(field, lambda block:
+        block.sum(block[field], block.window(start, stop)))
+
+def window_ratio(field: str, start: str, stop: str) -> Aggregation:
+    return Aggregation(field, lambda block:
+        block.sum(block[field], block.window(start, stop)) / block.sum(block[field]))
+
+def tail_volume_share(minutes: int = 30) -> Aggregation:
+    start = (pd.Timedelta(hours=15) - pd.Timedelta(minutes=minutes))
+    return window_ratio('volume', str(start).split()[-1], '15:00')
+
+def open_volume_share(minutes: int = 30) -> Aggregation:
+    stop = (pd.Timedelta(hours=9, minutes=30) + pd.Timedelta(minutes=minutes))
+    return window_ratio('volume', '09:30', str(stop).split()[-1])
+
+def vwap(price: str = 'close', volume: str = 'volume') -> Aggregation:
+    return Aggregation([price, volume], lambda block:
+        block.sum(block[price] * block[volume]) / block.sum(block[volume]))
+
+def intraday_volatility(price: str = 'close') -> Aggregation:
+    return Aggregation(price, lambda block:
+        block.std(block.diff(np.log(block[price]))))
+
+def iter_minute_blocks(
+    field: str | list,
+    start: str,
+    stop: str,
+    days_per_block: int = 20,
+    uri: str = QTM_URI,
+    calendar_uri: str = QTD_URI,
+    code_level: str | int = 0,
+    date_level: str | int = 1,
+    prefetch: bool = True,
+):
+    field = quool.parse_commastr(field)
+    table = quool.PanelTable(uri, code_level=code_level, date_level=date_level)
+    trading_days = ft.get_trading_days(calendar_uri, start, stop)
+    chunks = [trading_days[i:i + days_per_block]
+        for i in range(0, len(trading_days), days_per_block)]
+
+    def _read(chunk):
+        return table.read(field, start=chunk[0],
+            stop=chunk[-1] + pd.Timedelta(days=1, microseconds=-1))
+
+    if not prefetch:
+        for chunk in chunks:
+            data = _read(chunk)
+            if not data.empty:
+                yield IntradayBlock(data, code_level, date_level)
+        return
+
+    # read the next block while the current one is being aggregated
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(_read, chunks[0]) if chunks else None
+        for i in range(len(chunks)):
+            data = future.result()
+            if i + 1 < len(chunks):
+                future = executor.submit(_read, chunks[i + 1])
+            if not data.empty:
+                yield IntradayBlock(data, code_level, date_level)
+
+def aggregate(
+    aggregations: dict[str, Aggregation],
+    start: str,
+    stop: str,
+    days_per_block: int = 20,
+    uri: str = QTM_URI,
+    calendar_uri: str = QTD_URI,
+    code_level: str | int = 0,
+    date_level: str | int = 1,
+) -> dict[str, pd.DataFrame]:
+    fields = list(dict.fromkeys(f for agg in aggregations.values() for f in agg.fields))
+    parts = {name: [] for name in aggregations}
+    for block in iter_minute_blocks(fields, start, stop, days_per_block,
+        uri, calendar_uri, code_level, date_level):
+        for name, agg in aggregations.items():
+            parts[name].append(agg(block))
+    return {name: pd.concat(part).unstack(level=0) if part else pd.DataFrame()
+        for name, part in parts.items()}
+
+@tracing.traced()
 def get_tail_volume_percent(
     start: str, stop: str,
 ) -> pd.DataFrame:
-
-    def _get_tvp(td):
-        _data = ft.get_data(qtm_uri, "volume", start=td, stop=td + pd.Timedelta(days=1))
-        return _data.between_time("14:30", "15:00").sum(axis=0) / _data.sum(axis=0)
-        
-    qtm_uri = '/home/data/quotes-min'
-    qtd_uri = '/home/data/quotes-day'
-    trading_days = ft.get_trading_days(qtd_uri, start, stop)
-    return -pd.concat(Parallel(n_jobs=-1, backend='loky')
-        (delayed(_get_tvp)(td) for td in tqdm(trading_days)),
-        axis=0, keys=trading_days
-    ).swaplevel()
+    return -aggregate({"tvp": tail_volume_share(30)}, start, stop)["tvp"]
@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+
+
+class Panel:
+
+    # numpy and pandas hand mixed operations over to the panel
+    __array_priority__ = 1000
+    __pandas_priority__ = 5000
+
+    def __init__(
+        self,
+        values: np.ndarray,
+        index: pd.Index,
+        columns: pd.Index,
+    ):
+        if values.shape != (len(index), len(columns)):
+            raise ValueError(f"values of shape {values.shape} do not match "
+                f"axes of length {(len(index), len(columns))}")
+        self.values = values
+        self.index = index
+        self.columns = columns
+
+    @classmethod
+    def from_frame(
+        cls,
+        frame: pd.DataFrame,
+        dtype: str | np.dtype = 'float32',
+    ) -> 'Panel':
+        return cls(frame.to_numpy(dtype=dtype), frame.index, frame.columns)
+
+    def frame(self, dtype: str | np.dtype = None) -> pd.DataFrame:
+        values = self.values if dtype is None else self.values.astype(dtype, copy=False)
+        return pd.DataFrame(values, index=self.index, columns=self.columns, copy=False)
+
+    @property
+    def shape(self) -> tuple:
+        return self.values.shape
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.values.dtype
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __repr__(self) -> str:
+        return f"Panel({self.shape[0]} dates x {self.shape[1]} codes, {self.dtype})"
+
+    def astype(self, dtype: str | np.dtype) -> 'Panel':
+        return Panel(self.values.astype(dtype), self.index, self.columns)
+
+    def aligned(self, other: 'Panel') -> bool:
+        # panels loaded together share the axis objects, so this is mostly an identity check
+        return ((self.index is other.index or self.index.equals(other.index))
+            and (self.columns is other.columns or self.columns.equals(other.columns)))
+
+    def reindex(self, index: pd.Index = None, columns: pd.Index = None) -> 'Panel':
+        index = self.index if index is None else pd.Index(index)
+        columns = self.columns if columns is None else pd.Index(columns)
+        values = self.values
+        if not (index is self.index or index.equals(self.index)):
+            values = _take(values, self.index.get_indexer(index), axis=0)
+        if not (columns is self.columns or columns.equals(self.columns)):
+            values = _take(values, self.columns.get_indexer(columns), axis=1)
+        return Panel(values, index, columns)
+
+    def ffill(self) -> 'Panel':
+        valid = ~np.isnan(self.values)
+        rows = np.where(valid, np.arange(len(self.index))[:, None], 0)
+        np.maximum.accumulate(rows, axis=0, out=rows)
+        return Panel(np.take_along_axis(self.values, rows, axis=0), self.index, self.columns)
+
+    def shift(self, periods: int = 1) -> 'Panel':
+        values = np.full_like(self.values, np.nan)
+        if periods > 0:
+            values[periods:] = self.values[:-periods]
+        elif periods < 0:
+            values[:periods] = self.values[-periods:]
+        else:
+            values[:] = self.values
+        return Panel(values, self.index, self.columns)
+
+    def slice(self, start: str | pd.Timestamp = None, stop: str | pd.Timestamp = None) -> 'Panel':
+        rows = self.index.slice_indexer(start, stop)
+        return Panel(self.values[rows], self.index[rows], self.columns)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.values if dtype is None else self.values.astype(dtype)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if method != '__call__' or 'out' in kwargs:
+            return NotImplemented
+        inputs = [Panel.from_frame(x, self.dtype) if isinstance(x, pd.DataFrame) else x
+            for x in inputs]
+        panels = [x for x in inputs if isinstance(x, Panel)]
+        base = panels[0]
+        if not all(base.aligned(other) for other in panels[1:]):
+            # mismatched axes join like pandas does, on the union of dates and codes
+            index, columns = base.index, base.columns
+            for other in panels[1:]:
+                index, columns = index.union(other.index), columns.union(other.columns)
+            inputs = [x.reindex(index, columns) if isinstance(x, Panel) else x for x in inputs]
+            base = next(x for x in inputs if isinstance(x, Panel))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = ufunc(*[x.values if isinstance(x, Panel) else x for x in inputs], **kwargs)
+        if isinstance(result, tuple):
+            return tuple(Panel(r, base.index, base.columns) for r in result)
+        return Panel(result, base.index, base.columns)
+
+    def __add__(self, other):
+        return np.add(self, other)
+
+    def __radd__(self, other):
+        return np.add(other, self)
+
+    def __sub__(self, other):
+        return np.subtract(self, other)
+
+    def __rsub__(self, other):
+        return np.subtract(other, self)
+
+    def __mul__(self, other):
+        return np.multiply(self, other)
+
+    def __rmul__(self, other):
+        return np.multiply(other, self)
+
+    def __truediv__(self, other):
+        return np.true_divide(self, other)
+
+    def __rtruediv__(self, other):
+        return np.true_divide(other, self)
+
+    def __pow__(self, other):
+        return np.power(self, other)
+
+    def __neg__(self):
+        return np.negative(self)
+
+    def __abs__(self):
+        return np.abs(self)
+
+def _take(values: np.ndarray, indexer: np.ndarray, axis: int) -> np.ndarray:
+    # labels missing from the source come out as nan
+    result = np.take(values, np.maximum(indexer, 0), axis=axis)
+    missing = indexer < 0
+    if missing.any():
+        if result.dtype.kind != 'f':
+            result = result.astype('float64')
+        if axis == 0:
+            result[missing] = np.nan
+        else:
+            result[:, missing] = np.nan
+    return result
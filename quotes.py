@@ -0,0 +1,62 @@
+import time
+import threading
+import pandas as pd
+from pathlib import Path
+from abc import ABC, abstractmethod
+
+
+class QuoteProvider(ABC):
+
+    @abstractmethod
+    def fetch(self) -> pd.Series:
+        # percent change of the day indexed by six digit code
+        pass
+
+
+class AkshareQuotes(QuoteProvider):
+
+    def fetch(self) -> pd.Series:
+        import akshare as ak
+        quotes = ak.stock_zh_a_spot_em()
+        return pd.Series(quotes["涨跌幅"].to_numpy(dtype='float64'),
+            index=quotes["代码"].astype(str).to_numpy())
+
+
+class FileQuotes(QuoteProvider):
+
+    def __init__(self, path: str | Path, code: str = "代码", change: str = "涨跌幅"):
+        self.path = Path(path).expanduser()
+        self.code = code
+        self.change = change
+
+    def fetch(self) -> pd.Series:
+        if self.path.suffix == '.parquet':
+            quotes = pd.read_parquet(self.path, columns=[self.code, self.change])
+        else:
+            quotes = pd.read_csv(self.path, usecols=[self.code, self.change], dtype={self.code: str})
+        return pd.Series(quotes[self.change].to_numpy(dtype='float64'),
+            index=quotes[self.code].astype(str).str.zfill(6).to_numpy())
+
+
+class CachedQuotes(QuoteProvider):
+
+    def __init__(self, provider: QuoteProvider, ttl: float = 3):
+        self.provider = provider
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._quotes = None
+        self._fetched = 0
+
+    def expired(self) -> bool:
+        return self._quotes is None or time.monotonic() - self._fetched > self.ttl
+
+    def fetch(self) -> pd.Series:
+        if not self.expired():
+            return self._quotes
+        # only one request refreshes, the others wait for its result
+        with self._lock:
+            if self.expired():
+                quotes = self.provider.fetch()
+                self._quotes = quotes[~quotes.index.duplicated()]
+                self._fetched = time.monotonic()
+            return self._quotes
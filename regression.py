@@ -0,0 +1,136 @@
+import tracing
+import numpy as np
+import pandas as pd
+
+
+# dates per solved block, the design stack of a block is dates x codes x regressors
+CHUNKSIZE = 64
+
+
+def factorize(industry: np.ndarray) -> tuple[np.ndarray, pd.Index]:
+    # integer industry codes with -1 for missing labels
+    labels, categories = pd.factorize(np.asarray(industry).ravel(), sort=True)
+    return labels.reshape(np.shape(industry)), pd.Index(categories).astype(str)
+
+def design(
+    exposures: dict[str, np.ndarray] = None,
+    industry: np.ndarray = None,
+    categories: pd.Index = None,
+    intercept: bool = True,
+    shape: tuple[int, int] = None,
+) -> tuple[np.ndarray, list[str]]:
+    # (date, code, regressor) stack, industry labels become one dummy per label,
+    # the intercept is left out next to them since the dummies already sum to one;
+    # shape is the (date, code) shape of the response, an intercept alone needs it
+    exposures = exposures or {}
+    columns = [np.asarray(value, dtype='float64') for value in exposures.values()]
+    names = list(exposures)
+    if industry is not None:
+        if categories is None:
+            industry, categories = factorize(industry)
+        for i, category in enumerate(categories):
+            columns.append(np.where(industry < 0, np.nan, industry == i))
+            names.append(category)
+    elif intercept:
+        if shape is None and not columns:
+            raise ValueError("an intercept alone needs the shape of the response")
+        columns.insert(0, np.ones(columns[0].shape if shape is None else shape))
+        names.insert(0, 'intercept')
+    return np.stack(columns, axis=-1), names
+
+def solve(
+    y: np.ndarray,
+    x: np.ndarray,
+    weights: np.ndarray = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # weighted least squares of every date at once, y is (date, code) and x is
+    # (date, code, regressor); each date only uses the codes valid in all of them
+    valid = ~np.isnan(y) & ~np.isnan(x).any(axis=2)
+    if weights is not None:
+        valid &= ~np.isnan(weights) & (weights > 0)
+        weights = np.where(valid, weights, 0)
+    else:
+        weights = valid.astype('float64')
+    x = np.where(valid[..., None], x, 0)
+    xw = x * weights[..., None]
+    xtx = np.matmul(xw.transpose(0, 2, 1), x)
+    xty = np.matmul(xw.transpose(0, 2, 1), np.where(valid, y, 0)[..., None])[..., 0]
+    # a dummy without members on a date leaves the system singular
+    inverse = np.linalg.pinv(xtx)
+    coef = np.matmul(inverse, xty[..., None])[..., 0]
+    residual = np.where(valid, y - np.matmul(x, coef[..., None])[..., 0], np.nan)
+
+    count = valid.sum(axis=1)
+    dof = count - np.linalg.matrix_rank(xtx)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sigma = (weights * np.where(valid, residual, 0) ** 2).sum(axis=1) / dof
+        tstat = coef / np.sqrt(sigma[:, None] * np.diagonal(inverse, axis1=1, axis2=2))
+    empty = np.diagonal(xtx, axis1=1, axis2=2) == 0
+    coef[empty] = np.nan
+    tstat[empty | (dof <= 0)[:, None]] = np.nan
+    return residual, coef, tstat, count
+
+def _align(data: pd.DataFrame, index: pd.Index, columns: pd.Index, dtype=None) -> np.ndarray:
+    if data is None:
+        return None
+    return data.reindex(index=index, columns=columns).to_numpy(dtype=dtype)
+
+@tracing.traced()
+def regress(
+    y: pd.DataFrame,
+    exposures: dict[str, pd.DataFrame] = None,
+    industry: pd.DataFrame = None,
+    weights: pd.DataFrame = None,
+    intercept: bool = True,
+    chunksize: int = CHUNKSIZE,
+) -> dict[str, pd.DataFrame | pd.Series]:
+    index, columns = y.index, y.columns
+    values = y.to_numpy(dtype='float64')
+    exposures = {name: _align(data, index, columns, 'float64')
+        for name, data in (exposures or {}).items()}
+    categories = None
+    if industry is not None:
+        industry, categories = factorize(_align(industry, index, columns))
+    weights = _align(weights, index, columns, 'float64')
+
+    residual = np.full(values.shape, np.nan)
+    coef, tstat, count, names = [], [], [], []
+    for i in range(0, len(index), chunksize):
+        rows = slice(i, i + chunksize)
+        x, names = design({name: data[rows] for name, data in exposures.items()},
+            None if industry is None else industry[rows], categories, intercept,
+            values[rows].shape)
+        residual[rows], c, t, n = solve(values[rows], x,
+            None if weights is None else weights[rows])
+        coef.append(c)
+        tstat.append(t)
+        count.append(n)
+    if not coef:
+        coef = tstat = [np.zeros((0, 0))]
+        count = [np.zeros(0, dtype=int)]
+    return {
+        'residual': pd.DataFrame(residual, index=index, columns=columns),
+        'coef': pd.DataFrame(np.concatenate(coef), index=index, columns=names),
+        'tstat': pd.DataFrame(np.concatenate(tstat), index=index, columns=names),
+        'count': pd.Series(np.concatenate(count), index=index, name='count'),
+    }
+
+def neutralize(
+    factor: pd.DataFrame,
+    exposures: dict[str, pd.DataFrame] = None,
+    industry: pd.DataFrame = None,
+    weights: pd.DataFrame = None,
+    intercept: bool = True,
+) -> pd.DataFrame:
+    return regress(factor, exposures, industry, weights, intercept)['residual']
+
+def factor_returns(
+    price: pd.DataFrame,
+    exposures: dict[str, pd.DataFrame],
+    industry: pd.DataFrame = None,
+    weights: pd.DataFrame = None,
+    intercept: bool = True,
+) -> dict[str, pd.DataFrame | pd.Series]:
+    # exposures of date t explain the return earned from t to t + 1
+    returns = price.pct_change(fill_method=None).shift(-1)
+    return regress(returns, exposures, industry, weights, intercept)
@@ -0,0 +1,367 @@
+import warnings
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def _values(data: pd.DataFrame | np.ndarray) -> np.ndarray:
+    return np.asarray(data, dtype='float64')
+
+def _wrap(result: np.ndarray, like: pd.DataFrame | np.ndarray) -> pd.DataFrame | np.ndarray:
+    if isinstance(like, pd.DataFrame):
+        return pd.DataFrame(result, index=like.index, columns=like.columns)
+    return result
+
+def _window_sum(values: np.ndarray, window: int) -> np.ndarray:
+    # prefix sums turn every window into one subtraction
+    cumsum = np.zeros((values.shape[0] + 1,) + values.shape[1:])
+    np.cumsum(values, axis=0, out=cumsum[1:])
+    result = cumsum[1:].copy()
+    result[window:] -= cumsum[1:-window]
+    return result
+
+def _count(valid: np.ndarray, window: int) -> np.ndarray:
+    return _window_sum(valid.astype('float64'), window)
+
+def _center(values: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    # moments are shift invariant, centering keeps the prefix sums small
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        mean = np.nanmean(np.where(valid, values, np.nan), axis=0)
+    return np.where(valid, values - np.nan_to_num(mean), 0)
+
+def _poisoned(infinite: np.ndarray, window: int) -> np.ndarray:
+    # an infinite value is summed as zero so it cannot spoil the later prefix sums,
+    # the windows holding it come out nan like pandas rolling
+    return _count(infinite, window) > 0
+
+def _finish(result: np.ndarray, count: np.ndarray, min_periods: int) -> np.ndarray:
+    result[count < min_periods] = np.nan
+    return result
+
+def ts_delay(data: pd.DataFrame | np.ndarray, period: int = 1) -> pd.DataFrame | np.ndarray:
+    values = _values(data)
+    result = np.full_like(values, np.nan)
+    if period < values.shape[0]:
+        result[period:] = values[:values.shape[0] - period]
+    return _wrap(result, data)
+
+def ts_delta(data: pd.DataFrame | np.ndarray, period: int = 1) -> pd.DataFrame | np.ndarray:
+    values = _values(data)
+    return _wrap(values - _values(ts_delay(values, period)), data)
+
+def ts_sum(
+    data: pd.DataFrame | np.ndarray,
+    window: int,
+    min_periods: int = None,
+) -> pd.DataFrame | np.ndarray:
+    values = _values(data)
+    valid = ~np.isnan(values)
+    finite = np.isfinite(values)
+    result = _window_sum(np.where(finite, values, 0), window)
+    result[_poisoned(valid & ~finite, window)] = np.nan
+    return _wrap(_finish(result, _count(valid, window), min_periods or window), data)
+
+def ts_mean(
+    data: pd.DataFrame | np.ndarray,
+    window: int,
+    min_periods: int = None,
+) -> pd.DataFrame | np.ndarray:
+    values = _values(data)
+    valid = ~np.isnan(values)
+    finite = np.isfinite(values)
+    count = _count(valid, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = _window_sum(np.where(finite, values, 0), window) / count
+    result[_poisoned(valid & ~finite, window)] = np.nan
+    return _wrap(_finish(result, count, min_periods or window), data)
+
+def ts_std(
+    data: pd.DataFrame | np.ndarray,
+    window: int,
+    min_periods: int = None,
+    ddof: int = 1,
+) -> pd.DataFrame | np.ndarray:
+    values = _values(data)
+    valid = ~np.isnan(values)
+    finite = np.isfinite(values)
+    values = _center(values, finite)
+    count = _count(valid, window)
+    total = _window_sum(values, window)
+    square = _window_sum(values ** 2, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        var = (square - total ** 2 / count) / (count - ddof)
+    result = np.sqrt(np.maximum(var, 0))
+    result[(count <= ddof) | _poisoned(valid & ~finite, window)] = np.nan
+    return _wrap(_finish(result, count, min_periods or window), data)
+
+def ts_corr(
+    left: pd.DataFrame | np.ndarray,
+    right: pd.DataFrame | np.ndarray,
+    window: int,
+    min_periods: int = None,
+) -> pd.DataFrame | np.ndarray:
+    x, y = _values(left), _values(right)
+    valid = ~np.isnan(x) & ~np.isnan(y)
+    finite = valid & np.isfinite(x) & np.isfinite(y)
+    x, y = _center(x, finite), _center(y, finite)
+    count = _count(valid, window)
+    sx, sy = _window_sum(x, window), _window_sum(y, window)
+    sxx, syy = _window_sum(x * x, window), _window_sum(y * y, window)
+    sxy = _window_sum(x * y, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = sxy - sx * sy / count
+        result = cov / np.sqrt((sxx - sx ** 2 / count) * (syy - sy ** 2 / count))
+    result[(count < 2) | _poisoned(valid & ~finite, window)] = np.nan
+    return _wrap(_finish(result, count, min_periods or window), left)
+
+def decay_linear(
+    data: pd.DataFrame | np.ndarray,
+    window: int,
+    min_periods: int = None,
+) -> pd.DataFrame | np.ndarray:
+    # weights window, window - 1, ..., 1 from the newest row backwards,
+    # renormalized over the rows that are not missing
+    values = _values(data)
+    valid = ~np.isnan(values)
+    finite = np.isfinite(values)
+    values = np.where(finite, values, 0)
+    step = np.arange(values.shape[0], dtype='float64').reshape((-1,) + (1,) * (values.ndim - 1))
+    offset = window - step
+    weighted = offset * _window_sum(values, window) + _window_sum(values * step, window)
+    weights = offset * _count(valid, window) + _window_sum(valid * step, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = weighted / weights
+    result[_poisoned(valid & ~finite, window)] = np.nan
+    return _wrap(_finish(result, _count(valid, window), min_periods or window), data)
+
+def _windows(values: np.ndarray, window: int) -> np.ndarray:
+    padded = np.concatenate([np.full((window - 1,) + values.shape[1:], np.nan), values])
+    return sliding_window_view(padded, window, axis=0)
+
+def ts_rank(
+    data: pd.DataFrame | np.ndarray,
+    window: int,
+    min_periods: int = None,
+    pct: bool = False,
+    chunksize: int = 256,
+) -> pd.DataFrame | np.ndarray:
+    values = _values(data)
+    windows = _windows(values, window)
+    result = np.empty_like(values)
+    count = np.empty_like(values)
+    with np.errstate(invalid='ignore'):
+        for i in range(0, values.shape[0], chunksize):
+            block = windows[i:i + chunksize]
+            last = block[..., -1:]
+            count[i:i + chunksize] = (~np.isnan(block)).sum(axis=-1)
+            # average rank of the newest value, as pandas rolling rank does
+            result[i:i + chunksize] = (block < last).sum(axis=-1) \
+                + ((block == last).sum(axis=-1) + 1) / 2
+    result[np.isnan(values)] = np.nan
+    if pct:
+        result /= count
+    return _wrap(_finish(result, count, min_periods or window), data)
+
+def _ts_extreme(
+    data: pd.DataFrame | np.ndarray,
+    window: int,
+    min_periods: int,
+    func: callable,
+    chunksize: int = 256,
+) -> pd.DataFrame | np.ndarray:
+    values = _values(data)
+    windows = _windows(values, window)
+    result = np.empty_like(values)
+    with np.errstate(invalid='ignore'):
+        for i in range(0, values.shape[0], chunksize):
+            block = windows[i:i + chunksize]
+            result[i:i + chunksize] = func(np.where(np.isnan(block),
+                -np.inf if func is np.max else np.inf, block), axis=-1)
+    return _wrap(_finish(result, _count(~np.isnan(values), window), min_periods or window), data)
+
+def ts_max(data: pd.DataFrame | np.ndarray, window: int, min_periods: int = None):
+    return _ts_extreme(data, window, min_periods, np.max)
+
+def ts_min(data: pd.DataFrame | np.ndarray, window: int, min_periods: int = None):
+    return _ts_extreme(data, window, min_periods, np.min)
+
+
+class Rolling:
+
+    def __init__(
+        self,
+        window: int,
+        min_periods: int = None,
+        columns: pd.Index = None,
+        resync: int = 64,
+    ):
+        self.window = window
+        self.min_periods = min_periods or window
+        self.columns = pd.Index([]) if columns is None else pd.Index(columns)
+        self.resync = resync
+        self.steps = 0
+        self._x = np.full((window, len(self.columns)), np.nan)
+        self._y = np.full((window, len(self.columns)), np.nan)
+        self._head = 0
+        self._moments = {}
+        self._zero_moments()
+
+    def _zero_moments(self):
+        shape = len(self.columns)
+        self._moments = {name: np.zeros(shape) for name in
+            ("n", "ninf", "sx", "sxx", "nxy", "ninfp", "sxp", "syp", "sxxp", "syyp", "sxy", 
+            "wx", "wn")}
+
+    def _expand(self, columns: pd.Index):
+        new = columns.difference(self.columns)
+        if new.empty:
+            return
+        pad = np.full((self.window, len(new)), np.nan)
+        self._x = np.concatenate([self._x, pad], axis=1)
+        self._y = np.concatenate([self._y, pad], axis=1)
+        for name, moment in self._moments.items():
+            self._moments[name] = np.concatenate([moment, np.zeros(len(new))])
+        self.columns = self.columns.append(new)
+
+    def _align(self, row: pd.Series | np.ndarray) -> np.ndarray:
+        if isinstance(row, pd.Series):
+            self._expand(row.index)
+            return row.reindex(self.columns).to_numpy(dtype='float64')
+        row = np.asarray(row, dtype='float64')
+        if self.columns.empty:
+            # an unlabelled state takes its width from the first row, by position
+            self._expand(pd.RangeIndex(len(row)))
+        elif len(row) > len(self.columns):
+            raise ValueError(f"row of {len(row)} values is wider than the "
+                f"{len(self.columns)} columns of the state, pass columns for ndarray input")
+        return row
+
+    def _contribution(self, x: np.ndarray, y: np.ndarray, sign: float):
+        m = self._moments
+        # infinite values are counted apart and summed as zero, like the vectorized
+        # operators, so removing them later leaves finite moments behind
+        vx = ~np.isnan(x)
+        fx = np.isfinite(x)
+        x0 = np.where(fx, x, 0)
+        m["n"] += sign * vx
+        m["ninf"] += sign * (vx & ~fx)
+        m["sx"] += sign * x0
+        m["sxx"] += sign * x0 ** 2
+        pair = vx & ~np.isnan(y)
+        fpair = fx & np.isfinite(y)
+        xp, yp = np.where(fpair, x, 0), np.where(fpair, y, 0)
+        m["nxy"] += sign * pair
+        m["ninfp"] += sign * (pair & ~fpair)
+        m["sxp"] += sign * xp
+        m["syp"] += sign * yp
+        m["sxxp"] += sign * xp ** 2
+        m["syyp"] += sign * yp ** 2
+        m["sxy"] += sign * xp * yp
+
+    def update(
+        self,
+        row: pd.Series | np.ndarray,
+        other: pd.Series | np.ndarray = None,
+    ) -> 'Rolling':
+        x = self._align(row)
+        y = np.full_like(x, np.nan) if other is None else self._align(other)
+        if len(x) < len(self.columns):
+            x = np.concatenate([x, np.full(len(self.columns) - len(x), np.nan)])
+            y = np.concatenate([y, np.full(len(self.columns) - len(y), np.nan)])
+        old_x, old_y = self._x[self._head].copy(), self._y[self._head].copy()
+        # the linear decay sum shifts every weight down by one before adding the new row
+        m = self._moments
+        m["wx"] += self.window * np.where(np.isfinite(x), x, 0) - m["sx"]
+        m["wn"] += self.window * ~np.isnan(x) - m["n"]
+        self._contribution(old_x, old_y, -1)
+        self._contribution(x, y, 1)
+        self._x[self._head], self._y[self._head] = x, y
+        self._head = (self._head + 1) % self.window
+        self.steps += 1
+        if self.resync and self.steps % (self.window * self.resync) == 0:
+            self._recompute()
+        return self
+
+    def fit(
+        self,
+        data: pd.DataFrame | np.ndarray,
+        other: pd.DataFrame | np.ndarray = None,
+    ) -> 'Rolling':
+        # only the last window rows can still influence the state
+        if isinstance(data, pd.DataFrame):
+            self._expand(data.columns)
+            if other is not None:
+                self._expand(other.columns)
+                other = other.reindex(index=data.index, columns=self.columns)
+            data = data.reindex(columns=self.columns)
+        data = _values(data)[-self.window:]
+        other = None if other is None else _values(other)[-self.window:]
+        for i in range(len(data)):
+            self.update(data[i], None if other is None else other[i])
+        return self
+
+    def _ordered(self, buffer: np.ndarray) -> np.ndarray:
+        return np.roll(buffer, -self._head, axis=0)
+
+    def _recompute(self):
+        x, y = self._ordered(self._x), self._ordered(self._y)
+        self._zero_moments()
+        for i in range(self.window):
+            self._contribution(x[i], y[i], 1)
+        weight = np.arange(1, self.window + 1, dtype='float64')[:, None]
+        self._moments["wx"] = (np.where(np.isfinite(x), x, 0) * weight).sum(axis=0)
+        self._moments["wn"] = (~np.isnan(x) * weight).sum(axis=0)
+
+    def _output(self, result: np.ndarray, count: np.ndarray, infinite: np.ndarray = 0) -> pd.Series:
+        result = np.where((count >= self.min_periods) & (infinite == 0), result, np.nan)
+        return pd.Series(result, index=self.columns)
+
+    def sum(self) -> pd.Series:
+        return self._output(self._moments["sx"].copy(), self._moments["n"], self._moments["ninf"])
+
+    def mean(self) -> pd.Series:
+        m = self._moments
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self._output(m["sx"] / m["n"], m["n"], m["ninf"])
+
+    def std(self, ddof: int = 1) -> pd.Series:
+        m = self._moments
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = (m["sxx"] - m["sx"] ** 2 / m["n"]) / (m["n"] - ddof)
+        result = np.where(m["n"] > ddof, np.sqrt(np.maximum(var, 0)), np.nan)
+        return self._output(result, m["n"], m["ninf"])
+
+    def corr(self) -> pd.Series:
+        m = self._moments
+        n = m["nxy"]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov = m["sxy"] - m["sxp"] * m["syp"] / n
+            result = cov / np.sqrt((m["sxxp"] - m["sxp"] ** 2 / n) * (m["syyp"] - m["syp"] ** 2 / n))
+        return self._output(np.where(n >= 2, result, np.nan), n, m["ninfp"])
+
+    def decay_linear(self) -> pd.Series:
+        m = self._moments
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self._output(m["wx"] / m["wn"], m["n"], m["ninf"])
+
+    def delay(self, period: int = 1) -> pd.Series:
+        if period >= self.window:
+            raise ValueError(f"delay {period} needs a window larger than {self.window}")
+        return pd.Series(self._x[(self._head - 1 - period) % self.window], index=self.columns)
+
+    def rank(self, pct: bool = False) -> pd.Series:
+        x = self._x
+        last = x[(self._head - 1) % self.window]
+        count = (~np.isnan(x)).sum(axis=0)
+        result = (x < last).sum(axis=0) + ((x == last).sum(axis=0) + 1) / 2
+        result = np.where(np.isnan(last), np.nan, result)
+        if pct:
+            result = result / count
+        return self._output(result, count)
+
+    def max(self) -> pd.Series:
+        return self._output(np.where(np.isnan(self._x), -np.inf, self._x).max(axis=0), self._moments["n"])
+
+    def min(self) -> pd.Series:
+        return self._output(np.where(np.isnan(self._x), np.inf, self._x).min(axis=0), self._moments["n"])
@@ -0,0 +1,106 @@
+import time
+import threading
+import numpy as np
+import pandas as pd
+import factor as ft
+from pathlib import Path
+
+
+def _snapshot_path(uri: str, name: str) -> Path:
+    # dot directories are skipped by the parquet reader of the table
+    return Path(uri).expanduser() / '.snapshots' / f'{name}.snapshot'
+
+def make_snapshot(data: pd.DataFrame, depth: int = 1000) -> pd.DataFrame:
+    rank = data.rank(axis=1, ascending=False)
+    rank.index.name, rank.columns.name = 'date', 'code'
+    rank = rank.stack().rename('rank')
+    return rank[rank <= depth].reset_index()
+
+def write_snapshot(
+    data: pd.DataFrame,
+    name: str,
+    uri: str,
+    depth: int = 1000,
+    keep: int = 60,
+):
+    path = _snapshot_path(uri, name)
+    snapshot = make_snapshot(data, depth)
+    if path.exists():
+        old = pd.read_parquet(path)
+        snapshot = pd.concat([old[~old["date"].isin(snapshot["date"])], snapshot])
+    dates = np.sort(snapshot["date"].unique())[-keep:]
+    snapshot = snapshot[snapshot["date"].isin(dates)].sort_values(["date", "rank"])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    snapshot.to_parquet(tmp, index=False)
+    tmp.replace(path)
+
+def read_snapshot(name: str, uri: str) -> pd.DataFrame:
+    path = _snapshot_path(uri, name)
+    if not path.exists():
+        return pd.DataFrame(columns=["date", "code", "rank"])
+    return pd.read_parquet(path)
+
+
+class SnapshotStore:
+
+    def __init__(self, interval: float = 5, codelen: int = 6):
+        self.interval = interval
+        self.codelen = codelen
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def _split(self, snapshot: pd.DataFrame, complete: bool = False) -> dict:
+        # complete days rank every code, days of a snapshot file stop at its depth
+        days = {}
+        for date, group in snapshot.groupby("date", sort=False):
+            group = group.sort_values("rank")
+            codes = group["code"].astype(str).str.slice(0, self.codelen).to_numpy()
+            days[pd.Timestamp(date)] = (codes, group["rank"].to_numpy(dtype='float64'), complete)
+        return days
+
+    def _load(self, name: str, uri: str) -> dict:
+        key = (ft._normuri(uri), name)
+        path = _snapshot_path(uri, name)
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and now - entry["checked"] < self.interval:
+            return entry["days"]
+
+        # the snapshot is rewritten atomically by the dump job, so mtime tells a new file
+        mtime = path.stat().st_mtime_ns if path.exists() else None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry["mtime"] != mtime:
+                days = self._split(read_snapshot(name, uri)) if mtime else {}
+                if entry is not None:
+                    days = {**entry["days"], **days}
+                entry = self._entries[key] = {"mtime": mtime, "days": days}
+            entry["checked"] = now
+        return entry["days"]
+
+    def get(
+        self, 
+        name: str, 
+        uri: str, 
+        date: str | pd.Timestamp, 
+        topk: int = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        date = pd.Timestamp(date)
+        days = self._load(name, uri)
+        day = days.get(date)
+        # dates outside the snapshot, or a topk deeper than it, are ranked from the table
+        if day is None or (topk is not None and not day[2] and topk > len(day[0])):
+            data = ft.get_data(uri, name, date, date, cache=False)
+            days.update(self._split(make_snapshot(data, depth=data.shape[1]), complete=True))
+            # a date that is not dumped yet is not kept, it is read again once it is
+            day = days.get(date, (np.array([], dtype=object), np.array([]), False))
+        return day[0], day[1]
+
+    def topk(self, name: str, uri: str, date: str | pd.Timestamp, topk: int) -> np.ndarray:
+        codes, ranks = self.get(name, uri, date, topk)
+        return codes[:np.searchsorted(ranks, topk, side='left')]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,210 @@
+import hashlib
+import datetime
+import itertools
+import threading
+import numpy as np
+import pandas as pd
+import factor as ft
+from joblib import Parallel, delayed
+
+
+DEFAULTS = {
+    "name": 'ep', # factor name
+    "factor_uri": '/home/data/factordev', # factor table uri
+    "price_uri": '/home/data/quotes-day', # price table uri
+    "pool_uri": '/home/data/index-weights', # pool table uri
+    "benchmark_uri": '/home/data/index-quotes-day', # benchmark table uri
+    "start": '20180101', # backtest start
+    "stop": None, # backtest stop
+    "price": 'open', # the buy price to compute future return
+    "pool": None, # backtest pool
+    "preprocess": (("madoutlier", {"dev": 5}), "zscore"), # preprocessing chain
+    "rebalance": 5, # forward return horizon of the information coefficient
+    "method": 'pearson', # information coefficient method
+    "delay": 1, # the delayed days to execute buy
+    "ngroup": 10, # how many groups to divide
+    "topk": 100, # stocks held by the topk portfolio
+    "longshort": -1, # 1 longs the highest group, -1 the lowest
+    "commission": 0.005, # commission used in group test
+}
+
+def expand(grid: dict | list, base: dict = None) -> list[dict]:
+    # a dict of lists is crossed into every combination, a list of dicts is taken as is
+    if isinstance(grid, dict):
+        keys = list(grid)
+        grid = [dict(zip(keys, values)) for values in itertools.product(*grid.values())]
+    return [{**DEFAULTS, **(base or {}), **config} for config in grid]
+
+
+class Sweep:
+
+    def __init__(self, configs: list[dict]):
+        today = datetime.datetime.today().strftime(r'%Y%m%d')
+        self.configs = [{**config, "stop": config["stop"] or today} for config in configs]
+        self.loads = 0
+        self._fingerprints = {}
+        self._cache = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _memo(self, key: tuple, func: callable):
+        # every artifact is built once even when several threads ask for it together
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self._cache:
+                value = func()
+                with self._lock:
+                    self._cache[key] = value
+        return self._cache[key]
+
+    def _load(self, loader: callable, *args):
+        self.loads += 1
+        return loader(*args)
+
+    def price(self, c: dict) -> pd.DataFrame:
+        return self._memo(('price', c["price_uri"], c["price"], c["pool"], c["pool_uri"],
+            c["start"], c["stop"]), lambda: self._load(ft.get_price, c["price_uri"],
+            c["price"], c["pool"], c["pool_uri"], c["start"], c["stop"]))
+
+    def benchmark(self, c: dict) -> pd.Series:
+        if c["pool"] is None:
+            return None
+        return self._memo(('benchmark', c["benchmark_uri"], c["pool"], c["start"], c["stop"]),
+            lambda: self._load(ft.get_data, c["benchmark_uri"], "close",
+            c["start"], c["stop"], c["pool"], None).squeeze())
+
+    def raw(self, c: dict) -> pd.DataFrame:
+        return self._memo(('raw', c["factor_uri"], c["name"], c["pool"], c["pool_uri"],
+            c["start"], c["stop"]), lambda: self._load(ft.get_data, c["factor_uri"],
+            c["name"], c["start"], c["stop"], c["pool"], c["pool_uri"]))
+
+    def _data(self, c: dict) -> tuple:
+        return (c["factor_uri"], c["name"], c["price_uri"], c["price"],
+            c["pool"], c["pool_uri"], c["start"], c["stop"])
+
+    def _fingerprint(self, value: pd.DataFrame | pd.Series | np.ndarray) -> tuple:
+        # hashed by content, ids are reused once a frame is collected; the frame is
+        # kept next to its hash so the id cannot point to another one meanwhile
+        with self._lock:
+            known = self._fingerprints.get(id(value))
+        if known is not None and known[0] is value:
+            return known[1]
+        digest = hashlib.sha1()
+        if isinstance(value, np.ndarray):
+            digest.update(np.ascontiguousarray(value).tobytes())
+            digest.update(str(value.dtype).encode())
+        else:
+            digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+            if isinstance(value, pd.DataFrame):
+                digest.update(pd.util.hash_pandas_object(value.columns.to_series(), 
+                    index=False).to_numpy().tobytes())
+        fingerprint = (type(value).__name__, value.shape, digest.hexdigest())
+        with self._lock:
+            self._fingerprints[id(value)] = (value, fingerprint)
+        return fingerprint
+
+    def _key(self, value) -> tuple | str:
+        if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+            return self._fingerprint(value)
+        if isinstance(value, dict):
+            return tuple((k, self._key(v)) for k, v in value.items())
+        if isinstance(value, (list, tuple)):
+            return tuple(self._key(v) for v in value)
+        return repr(value)
+
+    def _chain(self, c: dict) -> tuple:
+        return self._key(c["preprocess"])
+
+    def factor(self, c: dict) -> pd.DataFrame:
+        return self._memo(('factor', self._data(c), self._chain(c)),
+            lambda: ft.Preprocessor(*c["preprocess"])(self.raw(c)))
+
+    def returns(self, c: dict) -> np.ndarray:
+        # daily returns on the factor axes, as the group test uses them
+        factor = self.factor(c)
+        return self._memo(('returns', self._data(c)), lambda: self.price(c).pct_change(
+            fill_method=None).reindex(index=factor.index, columns=factor.columns).fillna(0).to_numpy())
+
+    def forward(self, c: dict) -> tuple[np.ndarray, np.ndarray, pd.Index]:
+        # factor and forward returns joined like perform_inforcoef joins them
+        def build():
+            price = self.price(c)
+            future = price.shift(-c["rebalance"]) / price - 1
+            factor, future = self.factor(c).align(future, join='inner')
+            return factor.to_numpy(dtype='float64'), future.to_numpy(dtype='float64'), factor.index
+        return self._memo(('forward', self._data(c), self._chain(c), c["rebalance"]), build)
+
+    def ranks(self, c: dict) -> tuple[np.ndarray, np.ndarray]:
+        return self._memo(('ranks', self._data(c), self._chain(c)),
+            lambda: ft._rank(self.factor(c).to_numpy(dtype='float64')))
+
+    def labels(self, c: dict) -> np.ndarray:
+        return self._memo(('labels', self._data(c), self._chain(c), c["ngroup"]),
+            lambda: ft._qcut_labels(self.ranks(c)[0], c["ngroup"]))
+
+    def topk_labels(self, c: dict) -> np.ndarray:
+        return self._memo(('topk', self._data(c), self._chain(c), c["topk"], c["longshort"]),
+            lambda: ft._topk_labels(*self.ranks(c), c["longshort"], c["topk"], 1))
+
+    def evaluate(self, c: dict) -> dict:
+        row = {}
+        factor, future, index = self.forward(c)
+        inforcoef = pd.Series(ft._rowcorr(factor, future, c["method"]), index=index).dropna()
+        row["ic_mean"] = inforcoef.mean()
+        row["ic_std"] = inforcoef.std()
+        row["ic_ir"] = row["ic_mean"] / row["ic_std"]
+        row["ic_t"] = row["ic_ir"] * np.sqrt(inforcoef.count())
+        row["ic_positive_ratio"] = (inforcoef > 0).mean()
+
+        index, ngroup = self.factor(c).index, c["ngroup"]
+        returns = self.returns(c)
+        group_returns, group_turnover = ft._simulate_labels(
+            self.labels(c)[None], ngroup, returns, c["delay"], c["commission"])
+        topk_returns, topk_turnover = ft._simulate_labels(
+            self.topk_labels(c)[None], 1, returns, c["delay"], c["commission"])
+        longshort = c["longshort"] * (group_returns[:, ngroup - 1] - group_returns[:, 0])
+        benchmark = self.benchmark(c)
+        for prefix, ret, turn in [
+            ("longshort", longshort, None),
+            ("topk", topk_returns[:, 0], topk_turnover[:, 0]),
+        ]:
+            evaluation = ft._evaluate(pd.Series(ret, index=index),
+                None if turn is None else pd.Series(turn, index=index), benchmark)
+            for key, value in evaluation.items():
+                if isinstance(value, pd.Timedelta):
+                    value = value.days
+                if isinstance(value, (int, float, np.number)):
+                    row[f"{prefix}_{key}"] = value
+        # rank correlation of the mean group returns with the group order
+        row["group_monotonicity"] = pd.Series(group_returns.mean(axis=0)).corr(
+            pd.Series(np.arange(ngroup)), method='spearman')
+        return row
+
+    def run(self, n_jobs: int = -1) -> pd.DataFrame:
+        # raw inputs are read once up front, the configurations then share them in threads
+        for c in self.configs:
+            self.price(c), self.raw(c), self.benchmark(c)
+        rows = Parallel(n_jobs=n_jobs, prefer='threads')(
+            delayed(self.evaluate)(c) for c in self.configs)
+
+        params = pd.DataFrame([{k: (repr(ft.Preprocessor(*v)) if k == "preprocess" else v)
+            for k, v in c.items()} for c in self.configs])
+        varying = [k for k in params.columns if params[k].astype(str).nunique() > 1]
+        return pd.concat([params[varying], pd.DataFrame(rows)], axis=1)
+
+def sweep(grid: dict | list, base: dict = None, n_jobs: int = -1) -> pd.DataFrame:
+    return Sweep(expand(grid, base)).run(n_jobs)
+
+
+if __name__ == "__main__":
+    grid = {
+        "rebalance": [1, 5, 10, 20],
+        "ngroup": [5, 10],
+        "delay": [0, 1],
+        "preprocess": [(("madoutlier", {"dev": 5}), "zscore"), ("zscore",)],
+    }
+    result = sweep(grid)
+    print(result.to_string())
@@ -0,0 +1,46 @@
+import time
+import pytest
+import numpy as np
+import pandas as pd
+
+ft = pytest.importorskip("factor")
+
+
+def make_panel(ndays: int = 300) -> pd.DataFrame:
+    days = pd.bdate_range('2020-01-01', periods=ndays)
+    values = np.random.default_rng(0).normal(size=(ndays, 5))
+    return pd.DataFrame(values, index=days, columns=list('abcde'))
+
+def make_loader(data: pd.DataFrame, reads: list):
+    def loader(start, stop):
+        reads.append((start, stop))
+        return data.loc[start:stop]
+    return loader
+
+def test_partial_overlap_returns_requested_range(tmp_path):
+    data, reads = make_panel(), []
+    cache = ft.PanelCache()
+    loader = make_loader(data, reads)
+    days = data.index
+    cache.fetch("key", days[100], days[200], loader, sources=[tmp_path])
+    result = cache.fetch("key", days[150], days[250], loader, sources=[tmp_path])
+    pd.testing.assert_frame_equal(result, data.loc[days[150]:days[250]])
+    # only the uncovered tail is read, and the union stays cached
+    assert reads[-1][0] == days[200]
+    pd.testing.assert_frame_equal(cache.fetch("key", days[100], days[250], loader,
+        sources=[tmp_path]), data.loc[days[100]:days[250]])
+    assert cache.hits == 1
+
+def test_changed_fragments_invalidate(tmp_path):
+    data, reads = make_panel(), []
+    cache = ft.PanelCache(ttl=0)
+    loader = make_loader(data, reads)
+    days = data.index
+    (tmp_path / 'a.parquet').write_bytes(b'0')
+    cache.fetch("key", days[0], days[50], loader, sources=[tmp_path])
+    cache.fetch("key", days[0], days[50], loader, sources=[tmp_path])
+    assert len(reads) == 1
+    time.sleep(0.01)
+    (tmp_path / 'b.parquet').write_bytes(b'0')
+    cache.fetch("key", days[0], days[50], loader, sources=[tmp_path])
+    assert len(reads) == 2
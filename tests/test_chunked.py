@@ -0,0 +1,42 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+quool = pytest.importorskip("quool")
+import bench
+import chunked
+import factor as ft
+
+
+@pytest.fixture(scope='module')
+def store(tmp_path_factory):
+    root = tmp_path_factory.mktemp('store')
+    uris = bench.make_store(root, 120, 400)
+    # members change every 50 days, so positions and returns cross block edges
+    days = ft.get_calendar(uris["quotes"]).days
+    codes = ft.get_data(uris["factor"], 'factor').columns
+    rng = np.random.default_rng(0)
+    member = np.repeat(rng.random((len(days) // 50 + 1, len(codes))) < 0.6, 50, axis=0)
+    weights = pd.DataFrame(np.where(member[:len(days)], 1.0, np.nan), index=days, columns=codes)
+    uris["pool"] = str(root / 'index-weights')
+    (root / 'index-weights').mkdir()
+    ft.save_data(weights, 'pool', uris["pool"])
+    return uris
+
+@pytest.mark.parametrize("chunksize", [50, 37])
+def test_pooled_blocks_match_whole_read(store, chunksize):
+    preprocessor = ft.Preprocessor(("madoutlier", {"dev": 5}), "zscore")
+    price = ft.get_price(store["quotes"], 'open', 'pool', store["pool"])
+    factor = preprocessor(ft.get_data(store["factor"], 'factor', pool='pool', pooluri=store["pool"]))
+    inforcoef = ft.perform_inforcoef(factor, price, 5, image=None)
+    backtest = ft.perform_backtest(factor, price, -1, 20, image=None)
+
+    reader = chunked.read_blocks(store["factor"], 'factor', store["quotes"], 'open', 
+        None, None, 'pool', store["pool"], preprocessor, chunksize)
+    blocked, portfolios = chunked.evaluate(reader, 
+        chunked.ChunkedInforcoef(5), chunked.ChunkedBacktest(-1, 20))
+    pd.testing.assert_series_equal(ft.report_inforcoef(blocked, 5, image=None), 
+        inforcoef, check_names=False, check_freq=False)
+    portfolios = ft.report_backtest(portfolios, -1, 20, image=None)
+    for name in ['ngroup_returns', 'ngroup_turnover', 'topk_returns', 'topk_turnover']:
+        np.testing.assert_allclose(portfolios[name], backtest[name], rtol=1e-9, atol=1e-12)
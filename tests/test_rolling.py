@@ -0,0 +1,53 @@
+import warnings
+import numpy as np
+import pandas as pd
+import rolling
+
+
+def make_frame(nrow: int = 300, ncol: int = 4) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(rng.normal(size=(nrow, ncol)))
+    data.iloc[50, 0] = np.inf
+    data.iloc[120, 1] = -np.inf
+    data.iloc[200, 2] = np.nan
+    return data
+
+def decay_linear(data: pd.DataFrame, window: int) -> pd.DataFrame:
+    weights = np.arange(1, window + 1, dtype='float64')
+    return data.rolling(window).apply(lambda x: (x * weights).sum() / weights.sum(), raw=True)
+
+def test_infinite_values_match_pandas():
+    data, window = make_frame(), 20
+    other = pd.DataFrame(np.random.default_rng(1).normal(size=data.shape))
+    expected = {
+        "ts_sum": data.rolling(window).sum(),
+        "ts_mean": data.rolling(window).mean(),
+        "ts_std": data.rolling(window).std(),
+        "ts_corr": data.rolling(window).corr(other),
+        "decay_linear": decay_linear(data, window),
+    }
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', category=RuntimeWarning)
+        result = {
+            "ts_sum": rolling.ts_sum(data, window),
+            "ts_mean": rolling.ts_mean(data, window),
+            "ts_std": rolling.ts_std(data, window),
+            "ts_corr": rolling.ts_corr(data, other, window),
+            "decay_linear": rolling.decay_linear(data, window),
+        }
+    for name, frame in expected.items():
+        # pandas leaves a window holding an infinite value nan
+        frame = frame.where(~np.isinf(frame))
+        pd.testing.assert_frame_equal(result[name], frame, check_exact=False, 
+            rtol=1e-8, atol=1e-10, obj=name)
+
+def test_infinite_values_leave_state():
+    data, window = make_frame(), 20
+    state = rolling.Rolling(window, columns=data.columns)
+    for i in range(len(data)):
+        state.update(data.iloc[i])
+        if i == 180:
+            pd.testing.assert_series_equal(state.mean(), 
+                data.iloc[i - window + 1:i + 1].mean(), check_names=False)
+    expected = data.rolling(window).std().iloc[-1]
+    pd.testing.assert_series_equal(state.std(), expected, check_names=False)
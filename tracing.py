@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import atexit
+import threading
+import functools
+import pandas as pd
+from pathlib import Path
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+ENV = "FACTOR_TRACE"
+
+
+class Tracer:
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._ids = 0
+
+    def open(self, name: str, attrs: dict = None) -> dict:
+        stack = self._local.__dict__.setdefault("stack", [])
+        with self._lock:
+            self._ids += 1
+            sid = self._ids
+        record = {
+            "id": sid, "name": name, "parent": stack[-1]["id"] if stack else None,
+            "thread": threading.current_thread().name, "attrs": dict(attrs or {}),
+            "start": time.perf_counter(), "_rss": _peak_rss(),
+            "_counters": {key: func() for key, func in _counters.items()},
+        }
+        stack.append(record)
+        return record
+
+    def close(self, record: dict):
+        record["end"] = time.perf_counter()
+        record["seconds"] = record["end"] - record["start"]
+        # peak rss only grows, so the delta is what this span pushed the peak by
+        record["attrs"]["peak_rss_delta"] = max(_peak_rss() - record.pop("_rss"), 0)
+        for key, value in record.pop("_counters").items():
+            delta = _counters[key]() - value
+            if delta:
+                record["attrs"][key] = delta
+        stack = self._local.stack
+        if stack and stack[-1] is record:
+            stack.pop()
+        with self._lock:
+            self.spans.append(record)
+
+    def to_json(self) -> dict:
+        origin = min((span["start"] for span in self.spans), default=0)
+        spans = sorted(self.spans, key=lambda span: span["start"])
+        return {"pid": os.getpid(), "spans": [{**span, "start": span["start"] - origin,
+            "end": span["end"] - origin} for span in spans]}
+
+    def to_folded(self) -> list[str]:
+        # brendan gregg's folded stacks with self time in microseconds
+        spans = {span["id"]: span for span in self.spans}
+        children = {}
+        for span in self.spans:
+            children[span["parent"]] = children.get(span["parent"], 0) + span["seconds"]
+        stacks = {}
+        for span in self.spans:
+            names, node = [], span
+            while node is not None:
+                names.append(node["name"])
+                node = spans.get(node["parent"])
+            key = ';'.join([span["thread"]] + names[::-1])
+            own = max(span["seconds"] - children.get(span["id"], 0), 0)
+            stacks[key] = stacks.get(key, 0) + own
+        return [f"{key} {int(seconds * 1e6)}" for key, seconds in stacks.items()]
+
+    def summary(self) -> pd.DataFrame:
+        if not self.spans:
+            return pd.DataFrame()
+        data = pd.DataFrame([{"name": span["name"], "seconds": span["seconds"],
+            **span["attrs"]} for span in self.spans])
+        numeric = data.select_dtypes('number').columns
+        summary = data.groupby("name")[list(numeric)].sum()
+        summary.insert(0, "calls", data.groupby("name").size())
+        return summary.sort_values("seconds", ascending=False)
+
+    def dump(self, path: str | Path):
+        path = Path(str(path).format(pid=os.getpid())).expanduser()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_json(), indent=2, default=str))
+        path.with_suffix('.folded').write_text('\n'.join(self.to_folded()) + '\n')
+
+
+_tracer = None
+_counters = {}
+
+def _peak_rss() -> int:
+    if resource is None:
+        return 0
+    # kilobytes on linux, bytes on macos
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def sizeof(result) -> dict:
+    if isinstance(result, pd.DataFrame):
+        return {"rows": result.shape[0], "bytes": int(result.memory_usage(index=False).sum())}
+    if isinstance(result, pd.Series):
+        return {"rows": result.shape[0], "bytes": int(result.nbytes)}
+    if isinstance(result, dict):
+        sizes = [sizeof(value) for value in result.values()]
+        sizes = [size for size in sizes if size]
+        if sizes:
+            return {"rows": sum(size["rows"] for size in sizes),
+                "bytes": sum(size["bytes"] for size in sizes)}
+    return {}
+
+def enabled() -> bool:
+    return _tracer is not None
+
+def register_counter(name: str, func: callable):
+    _counters[name] = func
+
+@contextmanager
+def span(name: str, **attrs):
+    tracer = _tracer
+    if tracer is None:
+        yield None
+        return
+    record = tracer.open(name, attrs)
+    try:
+        yield record
+    finally:
+        tracer.close(record)
+
+def traced(name: str = None):
+    def decorator(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # a single global lookup when tracing is off
+            tracer = _tracer
+            if tracer is None:
+                return func(*args, **kwargs)
+            record = tracer.open(label)
+            try:
+                result = func(*args, **kwargs)
+                record["attrs"].update(sizeof(result))
+                return result
+            finally:
+                tracer.close(record)
+        return wrapper
+    return decorator
+
+@contextmanager
+def tracing(path: str | Path = None):
+    global _tracer
+    previous, tracer = _tracer, Tracer()
+    _tracer = tracer
+    try:
+        yield tracer
+    finally:
+        _tracer = previous
+        if path is not None:
+            tracer.dump(path)
+
+
+# FACTOR_TRACE=1 or FACTOR_TRACE=<path> traces the whole process, {pid} in the path
+# keeps worker processes from overwriting each other
+if os.environ.get(ENV):
+    _tracer = Tracer()
+    _path = os.environ[ENV]
+    atexit.register(_tracer.dump, 'factor-trace.json'
+        if _path.lower() in ('1', 'true', 'yes') else _path)